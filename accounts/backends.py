@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+# フォロー数はフォローのたびに update() で変わるので，キャッシュには含めず必要なときにDBから読む
+UNCACHED_FIELDS = ("follower_count", "following_count")
+
+
+def user_cache_key(user_id):
+    return f"accounts:user:{user_id}"
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    # セッションに紐づくユーザーの読み込みをAUTH_USER_CACHE["TIMEOUT"]秒キャッシュする
+    # リクエスト内では AuthenticationMiddleware が request.user を使い回すので，1リクエストで引くのは高々1回
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and password is not None:
+            # 後ろの ModelBackend は移行前のセッションを読むためだけに残しているので，同じパスワードをもう一度ハッシュさせない
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        if not settings.AUTH_USER_CACHE["ENABLED"]:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = get_user_model()._default_manager.defer(*UNCACHED_FIELDS).get(pk=user_id)
+            except get_user_model().DoesNotExist:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE["TIMEOUT"])
+        return user if self.user_can_authenticate(user) else None
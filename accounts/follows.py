@@ -0,0 +1,22 @@
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F
+
+from .models import FriendShip, User
+
+
+def update_follow_counts(follower_id, followee_id, delta):
+    User.objects.filter(pk=follower_id).update(following_count=F("following_count") + delta)
+    User.objects.filter(pk=followee_id).update(follower_count=F("follower_count") + delta)
+
+
+def unfollow(follower_id, followee_id):
+    # post_delete は DELETE が0行でも送られるので，同時に解除されても実際に消した側だけが数を減らす
+    with transaction.atomic():
+        deleted, _ = FriendShip.objects.filter(follower_id=follower_id, followee_id=followee_id).delete()
+        if deleted:
+            update_follow_counts(follower_id, followee_id, -1)
+    return deleted > 0
+
+
+aunfollow = sync_to_async(unfollow)
@@ -0,0 +1,110 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+
+from .models import FriendShip
+
+BATCH_SIZE = 1000
+
+
+def _contains(ids, user_id):
+    i = bisect_left(ids, user_id)
+    return i < len(ids) and ids[i] == user_id
+
+
+class FollowGraph:
+    # フォロー関係をフォロワーごとのソート済みID配列(followee_id)としてプロセス内に保持する
+    # 自プロセスでの変更はコミット時に反映し，他プロセスでの変更はTIMEOUT秒ごとの読み直しで追いつく
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._followees = OrderedDict()
+
+    @property
+    def config(self):
+        return settings.FOLLOW_GRAPH
+
+    def clear(self):
+        with self._lock:
+            self._followees.clear()
+
+    def _load(self, follower_ids):
+        loaded = {follower_id: array("q") for follower_id in follower_ids}
+        follower_ids = list(follower_ids)
+        for i in range(0, len(follower_ids), BATCH_SIZE):
+            rows = (
+                FriendShip.objects.filter(follower_id__in=follower_ids[i : i + BATCH_SIZE])
+                .order_by("follower_id", "followee_id")
+                .values_list("follower_id", "followee_id")
+            )
+            for follower_id, followee_id in rows.iterator(chunk_size=BATCH_SIZE * 10):
+                loaded[follower_id].append(followee_id)
+        return loaded
+
+    def _get_many(self, follower_ids):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for follower_id in follower_ids:
+                entry = self._followees.get(follower_id)
+                if entry is not None and entry[0] > now:
+                    self._followees.move_to_end(follower_id)
+                    found[follower_id] = entry[1]
+        missing = set(follower_ids) - found.keys()
+        if missing:
+            loaded = self._load(missing)
+            expires_at = now + self.config["TIMEOUT"]
+            with self._lock:
+                for follower_id, ids in loaded.items():
+                    self._followees[follower_id] = (expires_at, ids)
+                while len(self._followees) > self.config["MAX_USERS"]:
+                    self._followees.popitem(last=False)
+            found.update(loaded)
+        return found
+
+    def following_ids(self, follower_id):
+        return self._get_many([follower_id])[follower_id]
+
+    def follows(self, follower_id, followee_id):
+        return self.follows_many([(follower_id, followee_id)])[0]
+
+    def follows_many(self, pairs):
+        # (follower_id, followee_id) の組ごとにフォローしているかを返す
+        pairs = list(pairs)
+        if not self.config["ENABLED"]:
+            return self._follows_many_from_db(pairs)
+        followees = self._get_many({follower_id for follower_id, _ in pairs})
+        return [_contains(followees[follower_id], followee_id) for follower_id, followee_id in pairs]
+
+    def _follows_many_from_db(self, pairs):
+        by_follower = defaultdict(set)
+        for follower_id, followee_id in pairs:
+            by_follower[follower_id].add(followee_id)
+        followed = set()
+        for follower_id, followee_ids in by_follower.items():
+            rows = FriendShip.objects.filter(follower_id=follower_id, followee_id__in=followee_ids)
+            followed.update((follower_id, followee_id) for followee_id in rows.values_list("followee_id", flat=True))
+        return [pair in followed for pair in pairs]
+
+    def filter_followed(self, follower_id, user_ids):
+        # user_ids のうち follower_id がフォローしているものだけを順序を保って返す
+        user_ids = list(user_ids)
+        return [user_id for user_id, ok in zip(user_ids, self.follows_many((follower_id, u) for u in user_ids)) if ok]
+
+    def add(self, follower_id, followee_id):
+        with self._lock:
+            entry = self._followees.get(follower_id)
+            if entry is not None and not _contains(entry[1], followee_id):
+                insort(entry[1], followee_id)
+
+    def remove(self, follower_id, followee_id):
+        with self._lock:
+            entry = self._followees.get(follower_id)
+            if entry is not None and _contains(entry[1], followee_id):
+                entry[1].pop(bisect_left(entry[1], followee_id))
+
+
+follow_graph = FollowGraph()
@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class PasswordHashingBusy(Exception):
+    # 計算待ちが MAX_WORKERS + MAX_WAITING を超えたまま WAIT_TIMEOUT 秒たった(accounts.middleware が503にする)
+    pass
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING["MAX_WORKERS"], thread_name_prefix="password-hash")
+
+
+@lru_cache(maxsize=None)
+def get_slots():
+    return threading.BoundedSemaphore(
+        settings.PASSWORD_HASHING["MAX_WORKERS"] + settings.PASSWORD_HASHING["MAX_WAITING"]
+    )
+
+
+@receiver(setting_changed)
+def reset_executor(setting, **kwargs):
+    if setting == "PASSWORD_HASHING":
+        get_executor.cache_clear()
+        get_slots.cache_clear()
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # PBKDF2の計算を専用のスレッドプールで行い，同時に計算する数をMAX_WORKERSまでに抑える
+    # hashlib.pbkdf2_hmac は計算中にGILを手放すので，ログインが集中しても他のスレッドはフィードを返し続けられる
+    # 呼び出したワーカースレッドも計算が終わるまで待つので，待つ数はMAX_WAITINGまでとし，あふれた分はすぐに断る
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASHING["ITERATIONS"]
+
+    def encode(self, password, salt, iterations=None):
+        slots = get_slots()
+        if not slots.acquire(timeout=settings.PASSWORD_HASHING["WAIT_TIMEOUT"]):
+            raise PasswordHashingBusy
+        try:
+            return get_executor().submit(super().encode, password, salt, iterations).result()
+        finally:
+            slots.release()
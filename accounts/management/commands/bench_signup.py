@@ -0,0 +1,62 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from mysite.benchmark import benchmark_databases
+
+
+class Command(BaseCommand):
+    help = "サインアップ画面へ並列にPOSTし，1コアあたりの秒間サインアップ数を表示します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--signups", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=os.cpu_count())
+        parser.add_argument("--iterations", type=int, default=settings.PASSWORD_HASHING["ITERATIONS"])
+        parser.add_argument("--workers", type=int, default=settings.PASSWORD_HASHING["MAX_WORKERS"])
+
+    def handle(self, *args, **options):
+        # 計算待ちで断らず，スループットだけを測る
+        hashing = {
+            **settings.PASSWORD_HASHING,
+            "ITERATIONS": options["iterations"],
+            "MAX_WORKERS": options["workers"],
+            "MAX_WAITING": options["concurrency"],
+        }
+        with benchmark_databases(), override_settings(PASSWORD_HASHING=hashing):
+            elapsed, errors = self.run_load(options["signups"], options["concurrency"])
+
+        cores = min(options["concurrency"], options["workers"], os.cpu_count())
+        rate = (options["signups"] - errors) / elapsed
+        self.stdout.write(
+            f"iterations {options['iterations']}  workers {options['workers']}: "
+            f"{rate:8.1f} signups/s  {rate / cores:8.1f} signups/s/core  errors {errors}"
+        )
+
+    def run_load(self, total, concurrency):
+        url = reverse("accounts:signup")
+
+        def signup(i):
+            try:
+                response = Client().post(
+                    url,
+                    {
+                        "username": f"signup-{i}",
+                        "email": f"signup-{i}@example.com",
+                        "password1": "benchmark-password",
+                        "password2": "benchmark-password",
+                    },
+                )
+                return response.status_code != 302
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            errors = sum(executor.map(signup, range(total)))
+        return time.perf_counter() - started, errors
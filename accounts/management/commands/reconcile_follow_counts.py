@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import FriendShip, User
+
+BATCH_SIZE = 1000
+
+
+def count_by(field):
+    return (
+        FriendShip.objects.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(c=Count("id"))
+        .values("c")
+    )
+
+
+class Command(BaseCommand):
+    help = "フォロー数・フォロワー数を FriendShip テーブルの件数と照合し，ずれていれば修正します"
+
+    def handle(self, *args, **options):
+        drifted = (
+            User.objects.annotate(
+                actual_follower=Coalesce(Subquery(count_by("followee")), 0),
+                actual_following=Coalesce(Subquery(count_by("follower")), 0),
+            )
+            .filter(~Q(follower_count=F("actual_follower")) | ~Q(following_count=F("actual_following")))
+            .only("id", "follower_count", "following_count")
+        )
+
+        fixed = []
+        total = 0
+        for user in drifted.iterator(chunk_size=BATCH_SIZE):
+            user.follower_count = user.actual_follower
+            user.following_count = user.actual_following
+            fixed.append(user)
+            if len(fixed) >= BATCH_SIZE:
+                User.objects.bulk_update(fixed, ["follower_count", "following_count"])
+                total += len(fixed)
+                fixed = []
+        User.objects.bulk_update(fixed, ["follower_count", "following_count"])
+        total += len(fixed)
+
+        self.stdout.write(self.style.SUCCESS(f"{total}人のフォロー数を修正しました"))
@@ -0,0 +1,14 @@
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from .hashers import PasswordHashingBusy
+
+
+class PasswordHashingBusyMiddleware(MiddlewareMixin):
+    # パスワードの計算待ちがあふれたログイン・サインアップは，ワーカーを塞がずに503で返して再試行させる
+    def process_exception(self, request, exception):
+        if isinstance(exception, PasswordHashingBusy):
+            response = HttpResponse("混み合っています。しばらくしてから再度お試しください", status=503)
+            response["Retry-After"] = "1"
+            return response
+        return None
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-17 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0003_friendship_friendship_unique_friendship"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="is_pull_author",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.13 on 2026-10-17 16:24
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_counts(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    FriendShip = apps.get_model("accounts", "FriendShip")
+
+    def count_by(field):
+        return (
+            FriendShip.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(c=Count("id"))
+            .values("c")
+        )
+
+    User.objects.update(
+        follower_count=Coalesce(Subquery(count_by("followee")), 0),
+        following_count=Coalesce(Subquery(count_by("follower")), 0),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0004_user_is_pull_author"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="follower_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="following_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-17 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0005_user_follow_counts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["follower", "-created_at", "-id"], name="friendship_follower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["followee", "-created_at", "-id"], name="friendship_followee_idx"),
+        ),
+    ]
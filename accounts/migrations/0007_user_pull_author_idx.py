@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-17 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0006_friendship_created_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_pull_author", True)), fields=["is_pull_author"], name="user_pull_author_idx"
+            ),
+        ),
+    ]
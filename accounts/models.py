@@ -1,11 +1,19 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import Q, UniqueConstraint
 
 
 class User(AbstractUser):
     email = models.EmailField()
+    is_pull_author = models.BooleanField(default=False)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["is_pull_author"], condition=Q(is_pull_author=True), name="user_pull_author_idx")
+        ]
 
 
 class FriendShip(models.Model):
@@ -15,3 +23,7 @@ class FriendShip(models.Model):
 
     class Meta:
         constraints = [UniqueConstraint(fields=["follower", "followee"], name="unique_friendship")]
+        indexes = [
+            models.Index(fields=["follower", "-created_at", "-id"], name="friendship_follower_idx"),
+            models.Index(fields=["followee", "-created_at", "-id"], name="friendship_followee_idx"),
+        ]
@@ -0,0 +1,40 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import forget_user
+from .follows import update_follow_counts
+from .graph import follow_graph
+from .models import FriendShip, User
+
+
+@receiver(post_save, sender=FriendShip)
+def increment_follow_counts(sender, instance, created, **kwargs):
+    if created:
+        update_follow_counts(instance.follower_id, instance.followee_id, 1)
+        transaction.on_commit(lambda: follow_graph.add(instance.follower_id, instance.followee_id))
+
+
+@receiver(post_delete, sender=FriendShip)
+def decrement_follow_counts(sender, instance, origin=None, **kwargs):
+    # フォロー解除での数の更新は follows.unfollow() が行う(post_delete は DELETE が0行でも送られる)
+    # ここではユーザーの削除で連鎖して消えた行の分だけ，相手の数を減らす
+    if isinstance(origin, User):
+        update_follow_counts(instance.follower_id, instance.followee_id, -1)
+    transaction.on_commit(lambda: follow_graph.remove(instance.follower_id, instance.followee_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # パスワード変更やプロフィールの編集をキャッシュ済みのユーザーに反映する
+    # コミット前に別のリクエストが古い行を読み直してキャッシュすることがあるので，コミット後にもう一度消す
+    forget_user(instance.pk)
+    transaction.on_commit(lambda: forget_user(instance.pk))
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
@@ -1,12 +1,25 @@
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY
-from django.test import TestCase
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models.signals import pre_delete
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from accounts.models import FriendShip
-from tweets.models import Tweet
+from tweets.models import Like, Tweet
 
+from .backends import user_cache_key
+from .follows import unfollow
 from .forms import User
+from .graph import follow_graph
+from .hashers import PooledPBKDF2PasswordHasher, get_slots
+from .views import FollowerListView, FollowingListView, UserProfileView
 
 
 class TestSignupView(TestCase):
@@ -36,6 +49,20 @@ class TestSignupView(TestCase):
         self.assertTrue(User.objects.filter(username=valid_data["username"]).exists())
         self.assertIn(SESSION_KEY, self.client.session)
 
+    def test_success_post_hashes_password_once(self):
+        valid_data = {
+            "username": "testuser",
+            "email": "test@test.com",
+            "password1": "testpassword",
+            "password2": "testpassword",
+        }
+        encode = PooledPBKDF2PasswordHasher.encode
+        with mock.patch.object(PooledPBKDF2PasswordHasher, "encode", autospec=True, side_effect=encode) as mocked:
+            self.client.post(self.url, valid_data)
+
+        self.assertEqual(mocked.call_count, 1)
+        self.assertIn(SESSION_KEY, self.client.session)
+
     def test_failure_post_with_empty_username(self):
         invalid_data = {
             "username": "",
@@ -297,6 +324,79 @@ class TestUserProfileView(TestCase):
         self.assertEqual(response.context["following_count"], test_following_count)
         self.assertEqual(response.context["follower_count"], test_follower_count)
 
+    def test_success_get_with_stored_counts(self):
+        self.client.login(username="testuser1", password="testpass")
+        # セッション + ユーザー取得の2クエリ。ETagの計算で読んだプロフィールをそのまま描画に使う
+        with self.assertNumQueries(6):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.context["following_count"], 1)
+        self.assertEqual(response.context["follower_count"], 0)
+
+    def test_not_modified(self):
+        self.client.login(username="testuser1", password="testpass")
+        etag = self.client.get(self.url)["ETag"]
+        # セッション・ユーザー・プロフィールとツイートの集計の4クエリ。ページのツイートといいねは読まない
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(FEED_STREAMING={"ENABLED": True, "PAGE_SIZE": 5, "CHUNK_SIZE": 2})
+    def test_streaming_without_etag(self):
+        self.client.login(username="testuser1", password="testpass")
+        response = self.client.get(self.url)
+
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_modified_after_tweet_and_follow(self):
+        self.client.login(username="testuser1", password="testpass")
+        etag = self.client.get(self.url)["ETag"]
+        Tweet.objects.create(user=self.user1, content="new")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        FriendShip.objects.create(follower=self.user2, followee=self.user1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["follower_count"], 1)
+
+        etag = response["ETag"]
+        Like.objects.create(user=self.user1, tweet=Tweet.objects.filter(user=self.user1).first())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified_on_next_page(self):
+        self.client.login(username="testuser1", password="testpass")
+        for i in range(UserProfileView.page_size):
+            Tweet.objects.create(user=self.user1, content=f"tweet{i}")
+        cursor = self.client.get(self.url).context["next_cursor"]
+        etag = self.client.get(self.url, {"cursor": cursor})["ETag"]
+        response = self.client.get(self.url, {"cursor": cursor}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Tweet.objects.create(user=self.user1, content="new")
+        response = self.client.get(self.url, {"cursor": cursor}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_success_get_with_cursor(self):
+        self.client.login(username="testuser1", password="testpass")
+        for i in range(UserProfileView.page_size):
+            Tweet.objects.create(user=self.user1, content=f"tweet{i}")
+        tweets = list(Tweet.objects.filter(user=self.user1).order_by("-created_at", "-id"))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["profile_list"], tweets[: UserProfileView.page_size])
+
+        response = self.client.get(self.url, {"cursor": response.context["next_cursor"]})
+        self.assertEqual(response.context["profile_list"], tweets[UserProfileView.page_size :])
+        self.assertIsNone(response.context["next_cursor"])
+
 
 # class TestUserProfileEditView(TestCase):
 #     def test_success_get(self):
@@ -325,6 +425,10 @@ class TestFollowView(TestCase):
             target_status_code=200,
         )
         self.assertTrue(FriendShip.objects.filter(follower=self.user1).exists())
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 1)
+        self.assertEqual(self.user2.follower_count, 1)
 
     def test_failure_post_with_not_exist_user(self):
         url = reverse("accounts:follow", kwargs={"username": "testuser3"})
@@ -359,6 +463,10 @@ class TestUnfollowView(TestCase):
             target_status_code=200,
         )
         self.assertFalse(FriendShip.objects.filter(follower=self.user1).exists())
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+        self.assertEqual(self.user2.follower_count, 0)
 
     def test_failure_post_with_not_exist_tweet(self):
         url = reverse("accounts:unfollow", kwargs={"username": "testuser3"})
@@ -374,6 +482,67 @@ class TestUnfollowView(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertTrue(FriendShip.objects.filter(follower=self.user1).exists())
 
+    def test_concurrent_unfollow_decrements_once(self):
+        # 行を読んでからDELETEするまでの間に，別のリクエストが同じフォローを解除した状況を作る
+        def unfollow_concurrently(sender, instance, **kwargs):
+            pre_delete.disconnect(unfollow_concurrently, sender=FriendShip)
+            self.assertTrue(unfollow(instance.follower_id, instance.followee_id))
+
+        pre_delete.connect(unfollow_concurrently, sender=FriendShip)
+        self.addCleanup(pre_delete.disconnect, unfollow_concurrently, sender=FriendShip)
+        response = self.client.post(reverse("accounts:unfollow", kwargs={"username": "testuser2"}))
+
+        self.assertEqual(response.status_code, 400)
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+        self.assertEqual(self.user2.follower_count, 0)
+
+    def test_delete_followee_decrements_follower(self):
+        self.user2.delete()
+
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+
+
+class TestAsyncFollowView(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpass")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpass")
+        self.client.login(username="testuser1", password="testpass")
+
+    def test_success_post(self):
+        response = self.client.post(reverse("accounts:async_follow", kwargs={"username": "testuser2"}))
+
+        self.assertRedirects(response, reverse("tweets:home"), status_code=302, target_status_code=200)
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user2.follower_count, 1)
+
+    def test_failure_post_with_followed_user(self):
+        FriendShip.objects.create(follower=self.user1, followee=self.user2)
+        response = self.client.post(reverse("accounts:async_follow", kwargs={"username": "testuser2"}))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_post_with_not_exist_user(self):
+        response = self.client.post(reverse("accounts:async_follow", kwargs={"username": "testuser3"}))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_success_post_unfollow(self):
+        FriendShip.objects.create(follower=self.user1, followee=self.user2)
+        response = self.client.post(reverse("accounts:async_unfollow", kwargs={"username": "testuser2"}))
+
+        self.assertRedirects(response, reverse("tweets:home"), status_code=302, target_status_code=200)
+        self.assertFalse(FriendShip.objects.exists())
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.following_count, 0)
+
+    def test_failure_post_unfollow_with_not_followed_user(self):
+        response = self.client.post(reverse("accounts:async_unfollow", kwargs={"username": "testuser2"}))
+
+        self.assertEqual(response.status_code, 400)
+
 
 class TestFollowingListView(TestCase):
     def setUp(self):
@@ -386,6 +555,22 @@ class TestFollowingListView(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
+    def test_success_get_with_cursor(self):
+        url = reverse("accounts:following_list", kwargs={"username": "testuser1"})
+        users = [
+            User.objects.create_user(username=f"other{i}", password="testpass")
+            for i in range(FollowingListView.page_size + 1)
+        ]
+        friendships = [FriendShip.objects.create(**{"follower": self.user1, "followee": user}) for user in users][::-1]
+        response = self.client.get(url)
+
+        self.assertEqual(response.context["followee_list"], friendships[: FollowingListView.page_size])
+        self.assertIsNotNone(response.context["next_cursor"])
+
+        response = self.client.get(url, {"cursor": response.context["next_cursor"]})
+        self.assertEqual(response.context["followee_list"], friendships[FollowingListView.page_size :])
+        self.assertIsNone(response.context["next_cursor"])
+
 
 class TestFollowerListView(TestCase):
     def setUp(self):
@@ -397,3 +582,184 @@ class TestFollowerListView(TestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, 200)
+
+    def test_success_get_with_cursor(self):
+        url = reverse("accounts:follower_list", kwargs={"username": "testuser1"})
+        users = [
+            User.objects.create_user(username=f"other{i}", password="testpass")
+            for i in range(FollowerListView.page_size + 1)
+        ]
+        friendships = [FriendShip.objects.create(**{"followee": self.user1, "follower": user}) for user in users][::-1]
+        response = self.client.get(url)
+
+        self.assertEqual(response.context["follower_list"], friendships[: FollowerListView.page_size])
+        self.assertIsNotNone(response.context["next_cursor"])
+
+        response = self.client.get(url, {"cursor": response.context["next_cursor"]})
+        self.assertEqual(response.context["follower_list"], friendships[FollowerListView.page_size :])
+        self.assertIsNone(response.context["next_cursor"])
+
+
+class TestReconcileFollowCounts(TestCase):
+    def test_reconcile(self):
+        user1 = User.objects.create_user(username="testuser1", password="testpass")
+        user2 = User.objects.create_user(username="testuser2", password="testpass")
+        FriendShip.objects.create(follower=user1, followee=user2)
+        User.objects.filter(pk=user1.pk).update(following_count=5, follower_count=3)
+        call_command("reconcile_follow_counts", stdout=StringIO())
+        user1.refresh_from_db()
+        user2.refresh_from_db()
+
+        self.assertEqual((user1.following_count, user1.follower_count), (1, 0))
+        self.assertEqual((user2.following_count, user2.follower_count), (0, 1))
+
+
+@override_settings(FOLLOW_GRAPH={"ENABLED": True, "MAX_USERS": 2, "TIMEOUT": 60})
+class TestFollowGraph(TestCase):
+    def setUp(self):
+        follow_graph.clear()
+        self.addCleanup(follow_graph.clear)
+        self.users = [User.objects.create_user(username=f"testuser{i}", password="testpass") for i in range(4)]
+        FriendShip.objects.create(follower=self.users[0], followee=self.users[1])
+        FriendShip.objects.create(follower=self.users[0], followee=self.users[3])
+
+    def test_follows_many(self):
+        user_ids = [user.id for user in self.users]
+        with self.assertNumQueries(1):
+            result = follow_graph.follows_many((user_ids[0], user_id) for user_id in user_ids)
+        with self.assertNumQueries(0):
+            self.assertEqual(result, follow_graph.follows_many((user_ids[0], user_id) for user_id in user_ids))
+
+        self.assertEqual(result, [False, True, False, True])
+        self.assertEqual(follow_graph.filter_followed(user_ids[0], reversed(user_ids)), [user_ids[3], user_ids[1]])
+
+    def test_incremental_update(self):
+        user0, user1, user2, _ = self.users
+        self.assertFalse(follow_graph.follows(user0.id, user2.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendShip.objects.create(follower=user0, followee=user2)
+            FriendShip.objects.filter(follower=user0, followee=user1).delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(follow_graph.following_ids(user0.id).tolist(), [user2.id, self.users[3].id])
+
+    def test_evicts_least_recently_used(self):
+        follow_graph.follows_many((user.id, self.users[0].id) for user in self.users)
+        with self.assertNumQueries(1):
+            follow_graph.follows(self.users[0].id, self.users[1].id)
+
+    def test_follow_view_rejects_duplicate(self):
+        self.client.login(username="testuser0", password="testpass")
+        url = reverse("accounts:follow", kwargs={"username": "testuser1"})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FriendShip.objects.filter(follower=self.users[0]).count(), 2)
+
+    def test_follow_view_ignores_stale_graph(self):
+        self.assertTrue(follow_graph.follows(self.users[0].id, self.users[1].id))
+        # 他のプロセスでのフォロー解除(このプロセスのグラフには届かない)
+        FriendShip.objects.filter(follower=self.users[0], followee=self.users[1]).delete()
+
+        self.client.login(username="testuser0", password="testpass")
+        response = self.client.post(reverse("accounts:follow", kwargs={"username": "testuser1"}))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(FriendShip.objects.filter(follower=self.users[0], followee=self.users[1]).exists())
+
+
+@override_settings(
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db", AUTH_USER_CACHE={"ENABLED": True, "TIMEOUT": 60}
+)
+class TestCachedUser(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@test.com", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        self.url = reverse("tweets:home")
+
+    def test_authenticated_request_without_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("tweets:like_states"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.id)))
+
+    def test_password_change_invalidates_session(self):
+        self.client.get(self.url)
+        self.user.set_password("newpass")
+        self.user.save()
+        response = self.client.get(self.url)
+
+        self.assertRedirects(response, f"{reverse('accounts:login')}?next={self.url}")
+
+    def test_profile_edit_invalidates_cache(self):
+        self.client.get(self.url)
+        self.user.email = "new@test.com"
+        self.user.save()
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context["user"].email, "new@test.com")
+
+    def test_logout_invalidates_cache(self):
+        self.client.get(self.url)
+        self.client.post(reverse("accounts:logout"))
+
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+
+    def test_follow_counts_are_not_cached(self):
+        self.client.get(self.url)
+        another = User.objects.create_user(username="another", password="testpass")
+        FriendShip.objects.create(follower=self.user, followee=another)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context["user"].following_count, 1)
+
+    def test_session_from_model_backend(self):
+        self.client.force_login(self.user, backend="django.contrib.auth.backends.ModelBackend")
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["user"], self.user)
+
+    def test_failed_login_hashes_once(self):
+        self.client.logout()
+        with mock.patch.object(
+            ModelBackend, "authenticate", autospec=True, side_effect=ModelBackend.authenticate
+        ) as auth:
+            response = self.client.post(reverse("accounts:login"), {"username": "testuser", "password": "wrong"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(auth.call_count, 1)
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+
+class TestPasswordHashing(TestCase):
+    @override_settings(PASSWORD_HASHING={**settings.PASSWORD_HASHING, "ITERATIONS": 1000, "MAX_WORKERS": 1})
+    def test_configured_iterations(self):
+        encoded = make_password("testpass")
+
+        self.assertTrue(encoded.startswith("pbkdf2_sha256$1000$"))
+        self.assertTrue(check_password("testpass", encoded))
+        self.assertFalse(check_password("wrongpass", encoded))
+
+    def test_rehash_on_login_after_iterations_change(self):
+        with override_settings(PASSWORD_HASHING={**settings.PASSWORD_HASHING, "ITERATIONS": 1000, "MAX_WORKERS": 1}):
+            user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        user.refresh_from_db()
+
+        self.assertTrue(user.password.startswith(f"pbkdf2_sha256${settings.PASSWORD_HASHING['ITERATIONS']}$"))
+
+    @override_settings(PASSWORD_HASHING={"ITERATIONS": 1000, "MAX_WORKERS": 1, "MAX_WAITING": 0, "WAIT_TIMEOUT": 0})
+    def test_busy_login_fails_fast(self):
+        User.objects.create_user(username="testuser", password="testpass")
+        slots = get_slots()
+        slots.acquire()
+        self.addCleanup(slots.release)
+        response = self.client.post(reverse("accounts:login"), {"username": "testuser", "password": "testpass"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertNotIn(SESSION_KEY, self.client.session)
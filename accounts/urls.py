@@ -12,6 +12,8 @@ urlpatterns = [
     path("<str:username>/", views.UserProfileView.as_view(), name="user_profile"),
     path("<str:username>/follow/", views.FollowView.as_view(), name="follow"),
     path("<str:username>/unfollow/", views.UnFollowView.as_view(), name="unfollow"),
+    path("<str:username>/follow/async/", views.AsyncFollowView.as_view(), name="async_follow"),
+    path("<str:username>/unfollow/async/", views.AsyncUnFollowView.as_view(), name="async_unfollow"),
     path("<str:username>/following_list/", views.FollowingListView.as_view(), name="following_list"),
     path("<str:username>/follower_list/", views.FollowerListView.as_view(), name="follower_list"),
 ]
@@ -1,16 +1,25 @@
 from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth import authenticate, login
+from django.contrib.auth import login
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Count, Prefetch
-from django.http import HttpResponseBadRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Prefetch, Sum
+from django.http import Http404, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, DetailView, ListView, View
 
+from mysite.routers import PinPrimaryMixin, ReadReplicaMixin
+from tweets import cards
+from tweets.conditional import ConditionalGetMixin
+from tweets.counters import like_counter
 from tweets.models import Like, Tweet
+from tweets.pagination import CursorPaginationMixin, CursorPaginator, InvalidCursor
+from tweets.streaming import StreamingFeedMixin
 
+from .follows import aunfollow, unfollow
 from .forms import SignupForm
+from .mixins import AsyncLoginRequiredMixin
 from .models import FriendShip, User
 
 
@@ -21,87 +30,163 @@ class SignupView(CreateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        username = form.cleaned_data["username"]
-        password = form.cleaned_data["password1"]
-        user = authenticate(self.request, username=username, password=password)
-        login(self.request, user)
+        # パスワードは保存時にハッシュ済みなので，authenticate() でもう一度ハッシュせずにそのままログインする
+        login(self.request, self.object, backend="accounts.backends.CachedModelBackend")
         return response
 
 
-class UserProfileView(LoginRequiredMixin, DetailView):
+class UserProfileView(
+    LoginRequiredMixin, ReadReplicaMixin, ConditionalGetMixin, StreamingFeedMixin, CursorPaginationMixin, DetailView
+):
     model = User
     context_object_name = "profile"
     template_name = "accounts/profile.html"
     slug_field = "username"
     slug_url_kwarg = "username"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = self.object
+    def get_queryset(self):
+        return User.objects.annotate(
+            is_following=Exists(FriendShip.objects.filter(followee=OuterRef("pk"), follower=self.request.user))
+        )
+
+    def get_object(self, queryset=None):
+        # ETagの計算(get_etag_parts)で読んだプロフィールを描画でもそのまま使う
+        if not hasattr(self, "object"):
+            self.object = super().get_object(queryset)
+        return self.object
+
+    def get_etag_parts(self):
+        # ストリーミングではページを先に読み切らないので，ETagは付けない
+        if self.streaming:
+            return None
+        profile = self.get_object()
+        # ページのツイートは読み込まず，同じ範囲を (user, -created_at, -id) のインデックスで集計した1行で変化を見る
+        # バッファ中のいいね数(like_counter)は FLUSH_INTERVAL 秒以内にDBへ反映され，like_count の合計が変わる
+        try:
+            window = CursorPaginator(Tweet.objects.filter(user=profile), self.page_size).window(self.get_cursor())
+        except InvalidCursor:
+            raise Http404("無効なページです")
+        summary = Tweet.objects.filter(pk__in=window.values("pk")).aggregate(
+            count=Count("pk"),
+            ids=Sum("pk"),
+            like_count=Sum("like_count"),
+            liked=Sum("pk", filter=Exists(Like.objects.filter(tweet=OuterRef("pk"), user=self.request.user))),
+            newest=Max("created_at"),
+            oldest=Min("created_at"),
+        )
+        return (profile.follower_count, profile.following_count, profile.is_following, *summary.values())
 
-        context["profile_list"] = (
-            Tweet.objects.filter(user=user)
+    def get_tweet_queryset(self):
+        return (
+            Tweet.objects.filter(user=self.object)
             .select_related("user")
-            .prefetch_related(Prefetch("likes", queryset=Like.objects.filter(user=user), to_attr="is_liked"))
-            .annotate(liked_count=Count("likes"))
+            .prefetch_related(
+                Prefetch("likes", queryset=Like.objects.filter(user=self.request.user), to_attr="is_liked")
+            )
         )
-        context["following_count"] = FriendShip.objects.filter(follower=user).count()
-        context["follower_count"] = FriendShip.objects.filter(followee=user).count()
-        context["is_following"] = FriendShip.objects.filter(followee=user, follower=self.request.user).exists()
+
+    def get_streaming_page(self):
+        paginator = CursorPaginator(self.get_tweet_queryset(), settings.FEED_STREAMING["PAGE_SIZE"])
+        return paginator.stream_page(self.get_cursor(), settings.FEED_STREAMING["CHUNK_SIZE"])
+
+    def get_context_data(self, **kwargs):
+        user = self.object
+        profile_list = []
+        if not self.streaming:
+            profile_list = self.paginate_by_cursor(self.get_tweet_queryset())
+            like_counter.apply_pending(profile_list)
+            cards.render_cards(profile_list)
+        context = super().get_context_data(**kwargs)
+
+        context["profile_list"] = profile_list
+        context["following_count"] = user.following_count
+        context["follower_count"] = user.follower_count
+        context["is_following"] = user.is_following
 
         return context
 
 
-class FollowView(LoginRequiredMixin, View):
+class FollowView(LoginRequiredMixin, PinPrimaryMixin, View):
     def post(self, request, *args, **kwargs):
         follower = self.request.user
         followee = get_object_or_404(User, username=self.kwargs["username"])
 
         if follower == followee:
             return HttpResponseBadRequest("自分自身への操作は無効です")
-        elif FriendShip.objects.filter(follower=follower, followee=followee).exists():
+        # 既にフォロー済みかは一意制約で判定する(follow_graph は他プロセスの変更に遅れるので読み込み専用)
+        try:
+            with transaction.atomic():
+                FriendShip.objects.create(follower=follower, followee=followee)
+        except IntegrityError:
             return HttpResponseBadRequest("既にフォロー済みです")
-        else:
-            FriendShip.objects.create(follower=follower, followee=followee)
-            messages.success(request, f"{followee.username}をフォローしました")
-            return redirect("tweets:home")
+        messages.success(request, f"{followee.username}をフォローしました")
+        return redirect("tweets:home")
 
 
-class UnFollowView(LoginRequiredMixin, View):
+class UnFollowView(LoginRequiredMixin, PinPrimaryMixin, View):
     def post(self, request, *args, **kwargs):
         follower = self.request.user
         followee = get_object_or_404(User, username=self.kwargs["username"])
-        friendship = FriendShip.objects.filter(follower=follower, followee=followee).first()
 
         if follower == followee:
             return HttpResponseBadRequest("自分自身に対する操作は無効です")
-        elif friendship:
-            friendship.delete()
+        elif unfollow(follower.pk, followee.pk):
             messages.success(request, f"{followee.username}をフォロー解除しました")
             return redirect("tweets:home")
         else:
             return HttpResponseBadRequest("フォローしていないユーザーです")
 
 
-class FollowingListView(LoginRequiredMixin, ListView):
-    model = User
+async def aget_user_or_404(username):
+    try:
+        return await User.objects.aget(username=username)
+    except User.DoesNotExist:
+        raise Http404("ユーザーが存在しません")
+
+
+class AsyncFollowView(AsyncLoginRequiredMixin, PinPrimaryMixin, View):
+    # FollowView の非同期版。既存チェックと作成は aget_or_create の1呼び出しで行う
+    async def post(self, request, *args, **kwargs):
+        follower = request.user
+        followee = await aget_user_or_404(self.kwargs["username"])
+
+        if follower == followee:
+            return HttpResponseBadRequest("自分自身への操作は無効です")
+        _, created = await FriendShip.objects.aget_or_create(follower=follower, followee=followee)
+        if not created:
+            return HttpResponseBadRequest("既にフォロー済みです")
+        messages.success(request, f"{followee.username}をフォローしました")
+        return redirect("tweets:home")
+
+
+class AsyncUnFollowView(AsyncLoginRequiredMixin, PinPrimaryMixin, View):
+    async def post(self, request, *args, **kwargs):
+        follower = request.user
+        followee = await aget_user_or_404(self.kwargs["username"])
+
+        if follower == followee:
+            return HttpResponseBadRequest("自分自身に対する操作は無効です")
+        if not await aunfollow(follower.pk, followee.pk):
+            return HttpResponseBadRequest("フォローしていないユーザーです")
+        messages.success(request, f"{followee.username}をフォロー解除しました")
+        return redirect("tweets:home")
+
+
+class FollowingListView(LoginRequiredMixin, ReadReplicaMixin, CursorPaginationMixin, ListView):
+    model = FriendShip
     template_name = "accounts/followee_list.html"
+    context_object_name = "followee_list"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    def get_queryset(self):
         user = get_object_or_404(User, username=self.kwargs["username"])
+        return self.paginate_by_cursor(FriendShip.objects.filter(follower=user).select_related("followee"))
 
-        context["followee_list"] = FriendShip.objects.filter(follower=user).select_related("followee")
-        return context
 
-
-class FollowerListView(LoginRequiredMixin, ListView):
-    model = User
+class FollowerListView(LoginRequiredMixin, ReadReplicaMixin, CursorPaginationMixin, ListView):
+    model = FriendShip
     template_name = "accounts/follower_list.html"
+    context_object_name = "follower_list"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    def get_queryset(self):
         user = get_object_or_404(User, username=self.kwargs["username"])
-
-        context["follower_list"] = FriendShip.objects.filter(followee=user).select_related("follower")
-        return context
+        return self.paginate_by_cursor(FriendShip.objects.filter(followee=user).select_related("follower"))
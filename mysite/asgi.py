@@ -13,4 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from mysite.staticfiles import asgi_static_files  # noqa: E402
+from mysite.warmup import warm_templates  # noqa: E402
+from tweets.live import STREAM_PATH, stream_application  # noqa: E402
+
+warm_templates()
+
+# 静的ファイルも同期のミドルウェアを通さず，ASGIで直接返す
+django_application = asgi_static_files(django_application)
+
+
+async def application(scope, receive, send):
+    # ライブ更新のSSEはDjangoのビューを通さず，ASGIで直接ストリーミングする
+    if scope["type"] == "http" and scope["path"] == STREAM_PATH:
+        return await stream_application(scope, receive, send)
+    if scope["type"] == "http":
+        # ライブ更新を配信していることをテンプレートへ伝える(tweets.context_processors.live_updates)
+        scope = {**scope, "live_url": STREAM_PATH}
+    return await django_application(scope, receive, send)
@@ -0,0 +1,25 @@
+import statistics
+from contextlib import contextmanager
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def benchmark_databases():
+    # ベンチマークのコマンド用。本物のDBを汚さないよう，テストと同じ手順で使い捨てのDBを作る
+    # setup_test_environment() で ALLOWED_HOSTS に testserver も入るので，Client/AsyncClient でそのまま叩ける
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+def percentiles_ms(seconds, *points):
+    # 秒で測った値の points パーセンタイル(1〜99)をミリ秒で返す。2件以上必要
+    quantiles = statistics.quantiles([value * 1000 for value in seconds], n=100, method="inclusive")
+    return [round(quantiles[point - 1], 3) for point in points]
@@ -0,0 +1,82 @@
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+PINNED_UNTIL_SESSION_KEY = "_primary_pinned_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_read_alias = ContextVar("read_alias", default=None)
+
+
+@contextmanager
+def use_replica():
+    token = _read_alias.set(random.choice(settings.READ_REPLICAS) if settings.READ_REPLICAS else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def pin_to_primary(request):
+    request.session[PINNED_UNTIL_SESSION_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+
+
+def is_pinned_to_primary(request):
+    return request.session.get(PINNED_UNTIL_SESSION_KEY, 0) > time.time()
+
+
+class ReplicaRouter:
+    # use_replica() の中の読み込みだけをレプリカへ送る。書き込みは常にプライマリ(default)
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReadReplicaMixin:
+    # 読み込み専用のビューをレプリカで処理する。直前に書き込んだユーザーはプライマリに固定する
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.READ_REPLICAS or is_pinned_to_primary(request):
+            return super().dispatch(request, *args, **kwargs)
+        with use_replica():
+            response = super().dispatch(request, *args, **kwargs)
+            # TemplateResponseはテンプレート内の遅延クエリもレプリカで評価する
+            if hasattr(response, "render"):
+                response.render()
+        if response.streaming:
+            response.streaming_content = self._stream_from_replica(response.streaming_content)
+        return response
+
+    def _stream_from_replica(self, content):
+        with use_replica():
+            yield from content
+
+
+class PinPrimaryMixin:
+    # 書き込みに成功したら，そのセッションの読み込みをしばらくプライマリに固定する(read-your-writes)
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            return self._apin_after(request, response)
+        if self.should_pin(request, response):
+            pin_to_primary(request)
+        return response
+
+    async def _apin_after(self, request, response):
+        response = await response
+        if self.should_pin(request, response):
+            # セッションの読み込みはDBアクセスになるのでスレッドプールで行う
+            await sync_to_async(pin_to_primary)(request)
+        return response
+
+    def should_pin(self, request, response):
+        return settings.READ_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -20,12 +21,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/4.0/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = "django-insecure-x+hlabr82)0gfep+bo%6nsehz_n%5_w4*9u*pd9tllw10dj1s1"
+SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "django-insecure-x+hlabr82)0gfep+bo%6nsehz_n%5_w4*9u*pd9tllw10dj1s1")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get("DJANGO_DEBUG", "1") == "1"
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "").split(",") if host]
 
 
 # Application definition
@@ -50,6 +51,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "accounts.middleware.PasswordHashingBusyMiddleware",
 ]
 
 ROOT_URLCONF = "mysite.urls"
@@ -65,11 +67,27 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "tweets.context_processors.like_states",
+                "tweets.context_processors.live_updates",
             ],
         },
     },
 ]
 
+# 本番(DEBUG=False)ではテンプレートを一度だけパースして使い回す。テンプレートのデバッグ情報も記録しない
+# 起動時に mysite.warmup.warm_templates() でまとめて読み込んでおく
+if not DEBUG:
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        (
+            "django.template.loaders.cached.Loader",
+            [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ],
+        ),
+    ]
+
 WSGI_APPLICATION = "mysite.wsgi.application"
 
 
@@ -83,6 +101,90 @@ DATABASES = {
     }
 }
 
+# DJANGO_SQLITE_TUNING=1 で単一ノード向けのSQLite設定(mysite.sqlite3)を使う
+# BUSY_TIMEOUTはミリ秒，MMAP_SIZEはバイト，CACHE_SIZEは負ならKiB単位
+if os.environ.get("DJANGO_SQLITE_TUNING") == "1":
+    DATABASES["default"]["ENGINE"] = "mysite.sqlite3"
+
+SQLITE_TUNING = {
+    "BUSY_TIMEOUT": 5000,
+    "MMAP_SIZE": 256 * 1024 * 1024,
+    "CACHE_SIZE": -64000,
+}
+
+# DJANGO_DATABASE=postgresql で本番用のPostgreSQL設定に切り替える
+# 接続はCONN_MAX_AGE秒まで使い回し，再利用前にヘルスチェックする
+# PgBouncer(transaction pooling)経由の場合は POSTGRES_PGBOUNCER=1 でサーバーサイドカーソルを無効にする
+if os.environ.get("DJANGO_DATABASE") == "postgresql":
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("POSTGRES_DB", "mysite"),
+        "USER": os.environ.get("POSTGRES_USER", "mysite"),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+        "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.environ.get("POSTGRES_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
+        "DISABLE_SERVER_SIDE_CURSORS": os.environ.get("POSTGRES_PGBOUNCER") == "1",
+        "OPTIONS": {
+            "connect_timeout": int(os.environ.get("POSTGRES_CONNECT_TIMEOUT", "5")),
+        },
+    }
+
+
+# 読み込み専用のビュー(mysite.routers.ReadReplicaMixin)はREAD_REPLICASのいずれかを参照する
+# 例: DJANGO_READ_REPLICAS=replica (PostgreSQLなら POSTGRES_REPLICA_HOST，SQLiteなら SQLITE_REPLICA_NAME)
+# 指定がなければプライマリと同じDBへの別の接続になる。テストでは複製されない別のDBを作る
+DATABASES["replica"] = dict(DATABASES["default"])
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    DATABASES["replica"]["HOST"] = os.environ.get("POSTGRES_REPLICA_HOST", DATABASES["default"]["HOST"])
+    DATABASES["replica"]["TEST"] = {"NAME": f"test_{DATABASES['default']['NAME']}_replica"}
+else:
+    DATABASES["replica"]["NAME"] = os.environ.get("SQLITE_REPLICA_NAME", DATABASES["default"]["NAME"])
+READ_REPLICAS = [alias for alias in os.environ.get("DJANGO_READ_REPLICAS", "").split(",") if alias]
+# 書き込み後，この秒数はそのセッションの読み込みをプライマリに固定する
+REPLICA_PIN_SECONDS = 5
+DATABASE_ROUTERS = ["mysite.routers.ReplicaRouter"]
+
+# 複数プロセスでキャッシュを共有するには DJANGO_REDIS_URL=redis://... を指定する(要 redis パッケージ)
+# LocMemCacheの既定の上限(300件)ではツイートカード1ページ分も載らないので広げておく
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+SHARED_CACHE = bool(os.environ.get("DJANGO_REDIS_URL"))
+if SHARED_CACHE:
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["DJANGO_REDIS_URL"],
+    }
+
+# 共有キャッシュがあればセッションはキャッシュから読み，書き込み時だけDBへ保存する
+# LocMemCacheはプロセスごとなので，ログアウトしても他のプロセスのキャッシュにセッションが残る。その場合はDBから読む
+# DBを使わない場合は DJANGO_SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+SESSION_ENGINE = os.environ.get(
+    "DJANGO_SESSION_ENGINE",
+    "django.contrib.sessions.backends.cached_db" if SHARED_CACHE else "django.contrib.sessions.backends.db",
+)
+
+# PBKDF2の反復回数(ITERATIONS)と同時に計算するスレッド数(MAX_WORKERS)。accounts.hashers を参照
+# 計算待ちはMAX_WAITING件までで，空きをWAIT_TIMEOUT秒待っても入れなければ503を返す
+# 反復回数を変えると，既存ユーザーのハッシュは次のログイン時に新しい回数で作り直される
+PASSWORD_HASHING = {
+    "ITERATIONS": int(os.environ.get("DJANGO_PASSWORD_ITERATIONS", "390000")),
+    "MAX_WORKERS": int(os.environ.get("DJANGO_PASSWORD_HASH_WORKERS", "2")),
+    "MAX_WAITING": int(os.environ.get("DJANGO_PASSWORD_HASH_WAITING", "8")),
+    "WAIT_TIMEOUT": 0.5,
+}
+PASSWORD_HASHERS = [
+    "accounts.hashers.PooledPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -120,6 +222,12 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# 本番では collectstatic で内容のハッシュ付きのファイル名と .gz/.br を書き出し，
+# mysite.staticfiles がWSGI/ASGIアプリの手前で Cache-Control: immutable を付けて返す
+if not DEBUG:
+    STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
@@ -127,11 +235,58 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "accounts.User"
+# 以前のセッションには ModelBackend のパスが保存されているので，ログアウトさせないよう後ろに残す
+AUTHENTICATION_BACKENDS = ["accounts.backends.CachedModelBackend", "django.contrib.auth.backends.ModelBackend"]
+
+# ログイン中のユーザーをTIMEOUT秒キャッシュする(accounts.backends)
+# 保存・削除・ログアウトで破棄する。破棄が他のプロセスにも届くよう，共有キャッシュがあるときだけ有効にする
+AUTH_USER_CACHE = {
+    "ENABLED": SHARED_CACHE,
+    "TIMEOUT": 60,
+}
 
 LOGIN_URL = "accounts:login"
 LOGIN_REDIRECT_URL = "tweets:home"
 LOGOUT_REDIRECT_URL = "accounts:login"
 
+# フォロー時にタイムラインへ遡って追加するツイート数
+TIMELINE_BACKFILL_LIMIT = 800
+# フォロワー数がこれ以上のユーザーはファンアウトせず，読み込み時にマージする
+TIMELINE_PULL_THRESHOLD = 10000
+
+# ツイートカード(閲覧者に依存しない部分)のキャッシュ秒数
+TWEET_CARD_CACHE_TIMEOUT = 60 * 60
+
+# いいね数の更新をプロセス内に溜めて，件数(MAX_PENDING)か秒数(FLUSH_INTERVAL)でまとめてDBへ反映する
+LIKE_COUNTER_BUFFER = {
+    "ENABLED": False,
+    "MAX_PENDING": 500,
+    "FLUSH_INTERVAL": 1.0,
+}
+
+# フォロー関係をプロセス内のソート済みID配列で引く(accounts.graph)。ホームでフォロー中のpull型の著者を絞るのに使う
+# MAX_USERS人分までフォロワー単位で保持し，TIMEOUT秒で読み直す
+FOLLOW_GRAPH = {
+    "ENABLED": False,
+    "MAX_USERS": 100000,
+    "TIMEOUT": 60,
+}
+
+# ホーム・プロフィールのツイート一覧をストリーミングで返す(tweets.streaming)
+# PAGE_SIZE件までを1ページとし，CHUNK_SIZE件ずつDBから読んで送る
+FEED_STREAMING = {
+    "ENABLED": False,
+    "PAGE_SIZE": 500,
+    "CHUNK_SIZE": 50,
+}
+
+# ライブ更新(tweets.live)。BROKERは tweets.live.Broker の実装，HEARTBEATは秒，MAX_QUEUEは購読者ごとの最大滞留数
+LIVE_UPDATES = {
+    "BROKER": "tweets.live.InProcessBroker",
+    "HEARTBEAT": 15,
+    "MAX_QUEUE": 100,
+}
+
 SQL_DEBUG = False
 
 if SQL_DEBUG:
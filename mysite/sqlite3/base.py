@@ -0,0 +1,63 @@
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+# 同じDBファイルへの書き込みトランザクションはプロセス内でこのロックを順番に取る
+_write_locks = defaultdict(threading.Lock)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # 単一ノード向けのSQLite設定(WAL，synchronous=NORMAL，busy_timeout，mmap，キャッシュ)
+    # atomicブロックは BEGIN IMMEDIATE で始め，書き込みロックを先に確保して "database is locked" を避ける
+    holds_write_lock = False
+
+    @property
+    def tuning(self):
+        return settings.SQLITE_TUNING
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.tuning['BUSY_TIMEOUT'])}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA mmap_size = {int(self.tuning['MMAP_SIZE'])}")
+        conn.execute(f"PRAGMA cache_size = {int(self.tuning['CACHE_SIZE'])}")
+        return conn
+
+    @property
+    def write_lock(self):
+        return _write_locks[str(self.settings_dict["NAME"])]
+
+    def _start_transaction_under_autocommit(self):
+        self.write_lock.acquire()
+        self.holds_write_lock = True
+        try:
+            self.cursor().execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._release_write_lock()
+            raise
+
+    def _release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            self.write_lock.release()
+
+    def _commit(self):
+        try:
+            super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self._release_write_lock()
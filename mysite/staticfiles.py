@@ -0,0 +1,83 @@
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from whitenoise.base import WhiteNoise
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.string_utils import decode_path_info, ensure_leading_trailing_slash
+
+CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=None)
+def get_static_files():
+    # 設定(STATIC_ROOT, WHITENOISE_*)の読み込みとハッシュ付きファイルの immutable 判定は WhiteNoiseMiddleware のものを使う
+    # ミドルウェアは同期専用で，ASGIでは全リクエストがスレッドを経由してしまうので，Djangoの手前でだけ使う
+    return WhiteNoiseMiddleware()
+
+
+@receiver(setting_changed)
+def reset_static_files(setting, **kwargs):
+    if setting in ("DEBUG", "STATIC_ROOT", "STATIC_URL", "STATICFILES_STORAGE") or setting.startswith("WHITENOISE_"):
+        get_static_files.cache_clear()
+
+
+def find_static_file(path):
+    # STATIC_URL の外なら静的ファイルを読み込まずに None を返す
+    if not path.startswith(ensure_leading_trailing_slash(urlparse(settings.STATIC_URL or "").path)):
+        return None
+    static_files = get_static_files()
+    if static_files.autorefresh:
+        return static_files.find_file(path)
+    return static_files.files.get(path)
+
+
+def wsgi_static_files(application):
+    def static_application(environ, start_response):
+        static_file = find_static_file(decode_path_info(environ.get("PATH_INFO", "")))
+        if static_file is None:
+            return application(environ, start_response)
+        return WhiteNoise.serve(static_file, environ, start_response)
+
+    return static_application
+
+
+def asgi_static_files(application):
+    async def static_application(scope, receive, send):
+        static_file = find_static_file(scope["path"]) if scope["type"] == "http" else None
+        if static_file is None:
+            return await application(scope, receive, send)
+        await _serve(static_file, scope, send)
+
+    return static_application
+
+
+async def _serve(static_file, scope, send):
+    # WhiteNoise の応答(304・Range・.br/.gz の選択を含む)をそのままASGIで送る。ファイルはスレッドで読む
+    request_headers = {
+        "HTTP_" + name.decode("latin1").upper().replace("-", "_"): value.decode("latin1")
+        for name, value in scope["headers"]
+    }
+    response = await sync_to_async(static_file.get_response, thread_sensitive=False)(scope["method"], request_headers)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": int(response.status),
+            "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in response.headers],
+        }
+    )
+    if response.file is None:
+        await send({"type": "http.response.body", "body": b""})
+        return
+    try:
+        while True:
+            chunk = await sync_to_async(response.file.read, thread_sensitive=False)(CHUNK_SIZE)
+            more_body = len(chunk) == CHUNK_SIZE
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            if not more_body:
+                break
+    finally:
+        response.file.close()
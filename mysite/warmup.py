@@ -0,0 +1,16 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+
+def warm_templates():
+    # プロジェクトのテンプレートを起動時にすべて読み込み，cached.Loader に載せておく
+    # 最初のリクエストでパースしないようにするためで，読み込んだテンプレートの数を返す
+    names = []
+    for config in settings.TEMPLATES:
+        for directory in map(Path, config["DIRS"]):
+            names += [path.relative_to(directory).as_posix() for path in sorted(directory.rglob("*.html"))]
+    for name in names:
+        get_template(name)
+    return len(names)
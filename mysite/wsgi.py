@@ -13,4 +13,10 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
 
-application = get_wsgi_application()
+from mysite.staticfiles import wsgi_static_files  # noqa: E402
+from mysite.warmup import warm_templates  # noqa: E402
+
+# 静的ファイルはDjangoのミドルウェアを通さず，WSGIアプリの手前で返す
+application = wsgi_static_files(get_wsgi_application())
+
+warm_templates()
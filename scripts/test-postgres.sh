@@ -0,0 +1,23 @@
+#!/bin/sh
+# 使い捨てのPostgreSQLコンテナを起動して，テストスイートをPostgreSQL設定で実行する
+# 使い方: scripts/test-postgres.sh [manage.py test に渡す引数...]
+set -eu
+
+CONTAINER=mysite-test-postgres
+PORT=${POSTGRES_PORT:-55432}
+IMAGE=${POSTGRES_IMAGE:-postgres:15}
+
+docker run --rm -d --name "$CONTAINER" \
+    -e POSTGRES_USER=mysite -e POSTGRES_PASSWORD=mysite -e POSTGRES_DB=mysite \
+    -p "$PORT:5432" "$IMAGE" >/dev/null
+trap 'docker stop "$CONTAINER" >/dev/null' EXIT
+
+until docker exec "$CONTAINER" pg_isready -U mysite -d mysite >/dev/null 2>&1; do
+    sleep 1
+done
+
+cd "$(dirname "$0")/.."
+DJANGO_DATABASE=postgresql \
+POSTGRES_HOST=localhost POSTGRES_PORT="$PORT" \
+POSTGRES_USER=mysite POSTGRES_PASSWORD=mysite POSTGRES_DB=mysite \
+    python manage.py test "$@"
@@ -50,3 +50,66 @@ const changeStyle = (tweet_data, selector) => {
         count.innerHTML = tweet_data.liked_count;
     }
 }
+
+// いいね状態はサーバーで描画済みなので，戻る/進むでキャッシュから復元されたページでだけ取り直す
+// 一度に送れるIDは body の data-like-states-max-ids 件までなので，分けて取得する
+const loadLikeStates = async () => {
+    const url = document.body.dataset.likeStatesUrl;
+    const buttons = document.querySelectorAll('[data-tweet-id]');
+    if (!url || buttons.length === 0) {
+        return;
+    }
+    const ids = Array.from(buttons, (button) => button.dataset.tweetId);
+    const maxIds = Number(document.body.dataset.likeStatesMaxIds);
+
+    try{
+        for (let i = 0; i < ids.length; i += maxIds) {
+            const response = await fetch(`${url}?ids=${ids.slice(i, i + maxIds).join(',')}`);
+            if(!response.ok){
+                throw new Error('Response error');
+            }
+            const like_states = await response.json();
+            for (const tweet_data of like_states.tweets) {
+                changeStyle(tweet_data, document.getElementById(`tweet_${tweet_data.tweet_id}`));
+            }
+        }
+    } catch(error){
+        console.log(error.message);
+    }
+}
+
+window.addEventListener('pageshow', (event) => {
+    if (event.persisted) {
+        loadLikeStates();
+    }
+});
+
+// ASGIで動かしているとき(body に data-live-url があるとき)は，表示中のツイートのいいね数と，フォロー中のユーザーの新しいツイートを受け取る
+const subscribeLiveUpdates = () => {
+    const liveUrl = document.body.dataset.liveUrl;
+    if (!liveUrl) {
+        return;
+    }
+    const buttons = document.querySelectorAll('[data-tweet-id]');
+    const ids = Array.from(buttons, (button) => button.dataset.tweetId);
+    if (ids.length === 0 && !document.getElementById('new-tweets')) {
+        return;
+    }
+    const source = new EventSource(`${liveUrl}?ids=${ids.join(',')}`);
+
+    source.addEventListener('like', (event) => {
+        const tweet_data = JSON.parse(event.data);
+        const count = document.querySelector(`[name="count_${tweet_data.tweet_id}"]`);
+        if (count) {
+            count.innerHTML = tweet_data.liked_count;
+        }
+    });
+    source.addEventListener('tweet', () => {
+        const notice = document.getElementById('new-tweets');
+        if (notice) {
+            notice.hidden = false;
+        }
+    });
+}
+
+document.addEventListener('DOMContentLoaded', subscribeLiveUpdates);
@@ -0,0 +1,72 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.urls import get_script_prefix, reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = "tweets/card.html"
+LIKE_BUTTON_MARKER = mark_safe("<!-- like-button -->")
+PK_PLACEHOLDER = 987654321
+
+
+def cache_key(tweet_id):
+    return f"tweets:card:{tweet_id}"
+
+
+def card_version(tweet):
+    return f"{tweet.created_at.timestamp()}:{tweet.like_count}"
+
+
+def invalidate(tweet_id):
+    cache.delete(cache_key(tweet_id))
+
+
+@lru_cache(maxsize=None)
+def url_format(name, script_prefix):
+    # reverse() をツイートごとに呼ぶと1ページの描画時間の大半を占めるので，IDを差し込むだけの書式にしておく
+    return reverse(name, kwargs={"pk": PK_PLACEHOLDER}).replace(str(PK_PLACEHOLDER), "{}")
+
+
+@receiver(setting_changed)
+def reset_url_format(setting, **kwargs):
+    if setting == "ROOT_URLCONF":
+        url_format.cache_clear()
+
+
+def render_like_button(tweet, is_liked):
+    if is_liked:
+        name, label = "tweets:unlike", "いいね解除"
+    else:
+        name, label = "tweets:like", "いいね"
+    url = url_format(name, get_script_prefix()).format(tweet.id)
+    return format_html(
+        '<button id="tweet_{0}" data-tweet-id="{0}" onclick="Likebutton(tweet_{0})" data-url="{1}">{2}</button>',
+        tweet.id,
+        url,
+        label,
+    )
+
+
+def render_cards(tweets):
+    # 閲覧者に依存しない部分だけをキャッシュし，いいねボタンはその都度差し込む
+    tweets = list(tweets)
+    cached = cache.get_many([cache_key(tweet.id) for tweet in tweets])
+    template = None
+    missing = {}
+    for tweet in tweets:
+        key = cache_key(tweet.id)
+        entry = cached.get(key)
+        if entry is None or entry[0] != card_version(tweet):
+            template = template or get_template(CARD_TEMPLATE)
+            html = template.render({"tweet": tweet, "like_button": LIKE_BUTTON_MARKER})
+            entry = cached[key] = missing[key] = (card_version(tweet), *html.split(LIKE_BUTTON_MARKER))
+        _, head, tail = entry
+        tweet.card = mark_safe(head + render_like_button(tweet, getattr(tweet, "is_liked", False)) + tail)
+    if missing:
+        cache.set_many(missing, settings.TWEET_CARD_CACHE_TIMEOUT)
+    return tweets
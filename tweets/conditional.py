@@ -0,0 +1,23 @@
+import hashlib
+
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+class ConditionalGetMixin:
+    # get_etag_parts() の値からETagを作り，If-None-Match が一致すれば本来のクエリやテンプレートの描画をせずに304を返す
+    # 閲覧者ごとに内容(いいね済みかどうか，CSRFトークン)が変わるので，それらもETagに含めてブラウザにだけ保存させる
+    def get_etag_parts(self):
+        raise NotImplementedError
+
+    def get_etag(self, request, *args, **kwargs):
+        parts = self.get_etag_parts()
+        if parts is None:
+            return None
+        parts = (request.user.pk, request.META.get("CSRF_COOKIE"), *parts)
+        return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        response = condition(etag_func=self.get_etag)(super().get)(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,11 @@
+from .views import LikeStateView
+
+
+def like_states(request):
+    # ajax.js がいいね状態をまとめて取り直すときの，1回あたりのID数の上限
+    return {"like_states_max_ids": LikeStateView.max_ids}
+
+
+def live_updates(request):
+    # ライブ更新のSSEは mysite.asgi でだけ配信するので，そこを通ったリクエストにだけ購読先のURLを渡す
+    return {"live_url": getattr(request, "scope", {}).get("live_url")}
@@ -0,0 +1,92 @@
+import atexit
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Tweet
+
+
+class LikeCounterBuffer:
+    # いいね数の増減をプロセス内に溜め，まとめてDBへ反映する(write-behind)
+    # 未反映の差分は pending() で読み出して表示上の数に足す
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        self._flushing = Counter()
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    @property
+    def config(self):
+        return settings.LIKE_COUNTER_BUFFER
+
+    def add(self, tweet_id, delta):
+        if not self.config["ENABLED"]:
+            Tweet.objects.filter(id=tweet_id).update(like_count=F("like_count") + delta)
+            return
+        transaction.on_commit(lambda: self._buffer(tweet_id, delta))
+
+    def _buffer(self, tweet_id, delta):
+        with self._lock:
+            self._pending[tweet_id] += delta
+            should_flush = (
+                len(self._pending) >= self.config["MAX_PENDING"]
+                or time.monotonic() - self._last_flush >= self.config["FLUSH_INTERVAL"]
+            )
+            if not should_flush and self._timer is None:
+                self._timer = threading.Timer(self.config["FLUSH_INTERVAL"], self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if should_flush:
+            self.flush()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+    def pending(self, tweet_id):
+        with self._lock:
+            return self._pending[tweet_id] + self._flushing[tweet_id]
+
+    def apply_pending(self, tweets):
+        if not (self._pending or self._flushing):
+            return
+        for tweet in tweets:
+            tweet.like_count += self.pending(tweet.id)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._flushing, self._pending = self._pending, Counter()
+                self._last_flush = time.monotonic()
+
+            by_delta = defaultdict(list)
+            for tweet_id, delta in self._flushing.items():
+                if delta:
+                    by_delta[delta].append(tweet_id)
+            try:
+                if by_delta:
+                    with transaction.atomic():
+                        for delta, tweet_ids in by_delta.items():
+                            Tweet.objects.filter(id__in=tweet_ids).update(like_count=F("like_count") + delta)
+            except Exception:
+                with self._lock:
+                    self._pending.update(self._flushing)
+                    self._flushing = Counter()
+                raise
+            with self._lock:
+                self._flushing = Counter()
+
+
+like_counter = LikeCounterBuffer()
+atexit.register(like_counter.flush)
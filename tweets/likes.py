@@ -0,0 +1,167 @@
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import live
+from .counters import like_counter
+from .models import Like, Tweet
+
+LIKE_TABLE = Like._meta.db_table
+TWEET_TABLE = Tweet._meta.db_table
+
+# PostgreSQLはCTE内でINSERT/DELETEできるので，いいね/解除と件数の取得を1文で行う
+PG_LIKE_SQL = f"""
+WITH inserted AS (
+    INSERT INTO {LIKE_TABLE} (user_id, tweet_id, created_at)
+    SELECT %s, id, %s FROM {TWEET_TABLE} WHERE id = %s
+    ON CONFLICT (user_id, tweet_id) DO NOTHING
+    RETURNING tweet_id
+), updated AS (
+    UPDATE {TWEET_TABLE} SET like_count = like_count + 1
+    WHERE id IN (SELECT tweet_id FROM inserted)
+    RETURNING like_count
+)
+SELECT COALESCE((SELECT like_count FROM updated), (SELECT like_count FROM {TWEET_TABLE} WHERE id = %s))
+"""
+
+PG_UNLIKE_SQL = f"""
+WITH deleted AS (
+    DELETE FROM {LIKE_TABLE} WHERE user_id = %s AND tweet_id = %s
+    RETURNING tweet_id
+), updated AS (
+    UPDATE {TWEET_TABLE} SET like_count = like_count - 1
+    WHERE id IN (SELECT tweet_id FROM deleted)
+    RETURNING like_count
+)
+SELECT COALESCE((SELECT like_count FROM updated), (SELECT like_count FROM {TWEET_TABLE} WHERE id = %s))
+"""
+
+INSERT_LIKE_SQL = f"""
+INSERT INTO {LIKE_TABLE} (user_id, tweet_id, created_at)
+SELECT %s, id, %s FROM {TWEET_TABLE} WHERE id = %s
+ON CONFLICT (user_id, tweet_id) DO NOTHING
+RETURNING tweet_id
+"""
+
+DELETE_LIKE_SQL = f"""
+DELETE FROM {LIKE_TABLE} WHERE user_id = %s AND tweet_id = %s
+RETURNING tweet_id
+"""
+
+UPDATE_COUNT_SQL = f"""
+UPDATE {TWEET_TABLE} SET like_count = like_count + %s WHERE id = %s
+RETURNING like_count
+"""
+
+SELECT_COUNT_SQL = f"SELECT like_count FROM {TWEET_TABLE} WHERE id = %s"
+
+
+def _fetch_value(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _now():
+    return connection.ops.adapt_datetimefield_value(timezone.now())
+
+
+def _single_statement():
+    return connection.vendor == "postgresql" and not like_counter.config["ENABLED"]
+
+
+def _supports_returning():
+    return connection.vendor in ("postgresql", "sqlite") and connection.features.can_return_columns_from_insert
+
+
+def _settle(tweet_id, delta):
+    buffered = like_counter.config["ENABLED"]
+    if delta and not buffered and _supports_returning():
+        return _fetch_value(UPDATE_COUNT_SQL, [delta, tweet_id])
+    if delta:
+        like_counter.add(tweet_id, delta)
+    like_count = _fetch_value(SELECT_COUNT_SQL, [tweet_id])
+    if like_count is None:
+        return None
+    if not buffered:
+        return like_count
+    # バッファへの加算はコミット後なので，ここではまだ pending に含まれない
+    return like_count + like_counter.pending(tweet_id) + delta
+
+
+def _like(user_id, tweet_id):
+    if _single_statement():
+        return _fetch_value(PG_LIKE_SQL, [user_id, _now(), tweet_id, tweet_id])
+    with transaction.atomic():
+        if _supports_returning():
+            created = _fetch_value(INSERT_LIKE_SQL, [user_id, _now(), tweet_id]) is not None
+        elif Tweet.objects.filter(id=tweet_id).exists():
+            _, created = Like.objects.get_or_create(user_id=user_id, tweet_id=tweet_id)
+        else:
+            return None
+        return _settle(tweet_id, 1 if created else 0)
+
+
+def _unlike(user_id, tweet_id):
+    if _single_statement():
+        return _fetch_value(PG_UNLIKE_SQL, [user_id, tweet_id, tweet_id])
+    with transaction.atomic():
+        if _supports_returning():
+            deleted = _fetch_value(DELETE_LIKE_SQL, [user_id, tweet_id]) is not None
+        else:
+            deleted = Like.objects.filter(user_id=user_id, tweet_id=tweet_id).delete()[0] > 0
+        return _settle(tweet_id, -1 if deleted else 0)
+
+
+async def _asettle(tweet_id, delta):
+    buffered = like_counter.config["ENABLED"]
+    if delta and buffered:
+        await sync_to_async(like_counter.add)(tweet_id, delta)
+    elif delta:
+        await Tweet.objects.filter(id=tweet_id).aupdate(like_count=F("like_count") + delta)
+    like_count = await Tweet.objects.filter(id=tweet_id).values_list("like_count", flat=True).afirst()
+    if like_count is None or not buffered:
+        return like_count
+    # トランザクション外なので，バッファへの加算は pending に反映済み
+    return like_count + like_counter.pending(tweet_id)
+
+
+async def _alike(user_id, tweet_id):
+    if not await Tweet.objects.filter(id=tweet_id).aexists():
+        return None
+    _, created = await Like.objects.aget_or_create(user_id=user_id, tweet_id=tweet_id)
+    return await _asettle(tweet_id, 1 if created else 0)
+
+
+async def _aunlike(user_id, tweet_id):
+    deleted, _ = await Like.objects.filter(user_id=user_id, tweet_id=tweet_id).adelete()
+    return await _asettle(tweet_id, -1 if deleted else 0)
+
+
+def _published(tweet_id, liked_count):
+    # ライブ更新(tweets.live)の購読者へ，コミット後の件数を届ける
+    if liked_count is not None:
+        live.publish_like_count(tweet_id, liked_count)
+    return liked_count
+
+
+def like(user_id, tweet_id):
+    # いいね後の件数を返す。ツイートが存在しなければ None
+    return _published(tweet_id, _like(user_id, tweet_id))
+
+
+def unlike(user_id, tweet_id):
+    # いいね解除後の件数を返す。ツイートが存在しなければ None
+    return _published(tweet_id, _unlike(user_id, tweet_id))
+
+
+async def alike(user_id, tweet_id):
+    # like() の非同期版。非同期ORMの1呼び出しごとに自動コミットされる
+    return await sync_to_async(_published)(tweet_id, await _alike(user_id, tweet_id))
+
+
+async def aunlike(user_id, tweet_id):
+    # unlike() の非同期版
+    return await sync_to_async(_published)(tweet_id, await _aunlike(user_id, tweet_id))
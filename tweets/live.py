@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from accounts.models import FriendShip
+
+STREAM_PATH = "/tweets/stream/"
+MAX_TWEET_IDS = 100
+
+
+def author_channel(user_id):
+    return f"author:{user_id}"
+
+
+def tweet_channel(tweet_id):
+    return f"tweet:{tweet_id}"
+
+
+class Subscription:
+    # 購読者ごとのキュー。publish はワーカースレッドからも呼ばれるので，イベントループへ渡して積む
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, event, data):
+        self.loop.call_soon_threadsafe(self._put_nowait, (event, data))
+
+    def _put_nowait(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # 読み切れない遅いクライアントの分は捨てる。再接続時にページを読み直せばよい
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    # 配信方式を差し替えるためのインターフェース(LIVE_UPDATES["BROKER"])
+    def publish(self, channel, event, data):
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class InProcessBroker(Broker):
+    # 同じプロセスに接続している購読者にだけ届ける
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(event, data)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, settings.LIVE_UPDATES["MAX_QUEUE"])
+        with self._lock:
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscriptions = self._subscriptions.get(channel)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._subscriptions[channel]
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.LIVE_UPDATES["BROKER"])()
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    if setting == "LIVE_UPDATES":
+        get_broker.cache_clear()
+
+
+def publish_tweet(tweet):
+    transaction.on_commit(lambda: get_broker().publish(author_channel(tweet.user_id), "tweet", {"tweet_id": tweet.id}))
+
+
+def publish_like_count(tweet_id, liked_count):
+    transaction.on_commit(
+        lambda: get_broker().publish(
+            tweet_channel(tweet_id), "like", {"tweet_id": tweet_id, "liked_count": liked_count}
+        )
+    )
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def _load_user(scope):
+    request = ASGIRequest(scope, BytesIO())
+    request.session = import_string(settings.SESSION_ENGINE).SessionStore(
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    return get_user(request), request.GET.get("ids", "")
+
+
+def _channels_for(user, ids):
+    followee_ids = FriendShip.objects.filter(follower=user).values_list("followee_id", flat=True)
+    tweet_ids = [int(tweet_id) for tweet_id in ids.split(",") if tweet_id.isdigit()][:MAX_TWEET_IDS]
+    return [author_channel(user.id), *map(author_channel, followee_ids), *map(tweet_channel, tweet_ids)]
+
+
+async def stream_application(scope, receive, send):
+    # フォロー中のユーザーの新しいツイートIDと，?ids= で指定したツイートのいいね数を Server-Sent Events で送る
+    user, ids = await sync_to_async(_load_user)(scope)
+    if not user.is_authenticated:
+        await send({"type": "http.response.start", "status": 403, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    channels = await sync_to_async(_channels_for)(user, ids)
+    subscription = get_broker().subscribe(channels)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    next_event = None
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+        while True:
+            next_event = next_event or asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=settings.LIVE_UPDATES["HEARTBEAT"],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                break
+            if next_event in done:
+                body, next_event = format_event(*next_event.result()), None
+            else:
+                body = b":\n\n"
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+    finally:
+        subscription.close()
+        disconnected.cancel()
+        if next_event is not None:
+            next_event.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
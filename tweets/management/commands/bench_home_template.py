@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from tweets.cards import cache_key, render_cards
+from tweets.models import Tweet
+
+LOADERS = ["django.template.loaders.filesystem.Loader", "django.template.loaders.app_directories.Loader"]
+MODES = {
+    "uncached": LOADERS,
+    "cached": [("django.template.loaders.cached.Loader", LOADERS)],
+}
+
+
+class Command(BaseCommand):
+    help = "ツイートを並べたホーム画面(tweets/home.html)を繰り返し描画し，テンプレートの秒間描画数を表示します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tweets", type=int, default=500)
+        parser.add_argument("--seconds", type=float, default=3.0)
+
+    def handle(self, *args, **options):
+        # DBには保存せず，描画に必要な属性だけを持ったツイートを使う
+        user = User(id=1, username="benchmark")
+        now = timezone.now()
+        tweets = [
+            Tweet(id=i, user=user, content=f"benchmark tweet {i}", created_at=now, like_count=i % 7)
+            for i in range(1, options["tweets"] + 1)
+        ]
+        request = RequestFactory().get(reverse("tweets:home"))
+        request.user = user
+        for mode, loaders in MODES.items():
+            config = settings.TEMPLATES[0]
+            template = {**config, "APP_DIRS": False, "OPTIONS": {**config["OPTIONS"], "loaders": loaders}}
+            with override_settings(TEMPLATES=[template]):
+                rendered, elapsed = self.run_load(tweets, request, options["seconds"])
+            self.stdout.write(f"{mode:>8}: {rendered / elapsed:8.1f} pages/s ({options['tweets']} tweets)")
+
+    def run_load(self, tweets, request, seconds):
+        rendered = 0
+        cache.delete_many([cache_key(tweet.id) for tweet in tweets])
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            render_to_string("tweets/home.html", {"tweet_list": render_cards(tweets)}, request)
+            rendered += 1
+        return rendered, time.perf_counter() - started
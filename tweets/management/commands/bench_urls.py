@@ -0,0 +1,263 @@
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+from io import StringIO
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts import urls as accounts_urls
+from accounts.follows import unfollow
+from accounts.models import FriendShip, User
+from mysite.benchmark import benchmark_databases, percentiles_ms
+from tweets import likes
+from tweets import urls as tweets_urls
+from tweets.models import Like, Tweet
+
+PREFIX = "bench"
+PASSWORD = "password"
+# サインアップはパスワードの検証を通る値で行う
+SIGNUP_PASSWORD = "benchmark-signup-9173"
+
+# (計測名, URL名, シナリオのメソッド名)。シナリオは準備(計測しない)をしてから (client, method, url, data) を返す
+ROUTES = [
+    ("tweets:home", "tweets:home", "home"),
+    ("tweets:like_states", "tweets:like_states", "like_states"),
+    ("tweets:create GET", "tweets:create", "create_form"),
+    ("tweets:create POST", "tweets:create", "create"),
+    ("tweets:detail", "tweets:detail", "detail"),
+    ("tweets:delete GET", "tweets:delete", "delete_form"),
+    ("tweets:delete POST", "tweets:delete", "delete"),
+    ("tweets:like", "tweets:like", "like"),
+    ("tweets:unlike", "tweets:unlike", "unlike"),
+    ("tweets:async_like", "tweets:async_like", "like"),
+    ("tweets:async_unlike", "tweets:async_unlike", "unlike"),
+    ("accounts:signup GET", "accounts:signup", "signup_form"),
+    ("accounts:signup POST", "accounts:signup", "signup"),
+    ("accounts:login GET", "accounts:login", "login_form"),
+    ("accounts:login POST", "accounts:login", "login"),
+    ("accounts:logout", "accounts:logout", "logout"),
+    ("accounts:user_profile", "accounts:user_profile", "user_profile"),
+    ("accounts:follow", "accounts:follow", "follow"),
+    ("accounts:unfollow", "accounts:unfollow", "unfollow"),
+    ("accounts:async_follow", "accounts:async_follow", "follow"),
+    ("accounts:async_unfollow", "accounts:async_unfollow", "unfollow"),
+    ("accounts:following_list", "accounts:following_list", "follow_list"),
+    ("accounts:follower_list", "accounts:follower_list", "follow_list"),
+]
+
+
+def url_names():
+    return {
+        f"{module.app_name}:{pattern.name}"
+        for module in (tweets_urls, accounts_urls)
+        for pattern in module.urlpatterns
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "生成したデータ(generate_load_data)を入れたテスト用DBで tweets/ と accounts/ の全URLを叩き，"
+        "p50/p95/p99レイテンシ・1リクエストあたりのクエリ数・ピークメモリをJSONに書き出します"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--tweets", type=int, default=20000)
+        parser.add_argument("--follows", type=int, default=20)
+        parser.add_argument("--likes", type=int, default=50000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--requests", type=int, default=50, help="URLごとの計測回数")
+        parser.add_argument("--output", default="bench_urls.json")
+        parser.add_argument("--baseline", help="比較する以前の結果(JSON)")
+
+    def handle(self, *args, **options):
+        missing = url_names() - {url_name for _, url_name, _ in ROUTES}
+        if missing:
+            raise CommandError(f"計測シナリオのないURLがあります: {', '.join(sorted(missing))}")
+        if options["requests"] < 2:
+            raise CommandError("--requests は2以上にしてください")
+
+        dataset = {key: options[key] for key in ("users", "tweets", "follows", "likes", "seed")}
+        with benchmark_databases():
+            call_command("generate_load_data", prefix=PREFIX, stdout=StringIO(), **dataset)
+            self.prepare()
+            routes = {
+                label: self.measure(url_name, scenario, options["requests"]) for label, url_name, scenario in ROUTES
+            }
+
+        result = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "dataset": dataset,
+            "requests": options["requests"],
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "routes": routes,
+        }
+        with open(options["output"], "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        self.report(routes, options["baseline"])
+        self.stdout.write(self.style.SUCCESS(f"{options['output']} に書き出しました"))
+
+    def prepare(self):
+        # フォロー数が中央値のユーザーを閲覧者にし，フォロワーの最も多いユーザーのプロフィールを見る
+        users = User.objects.filter(username__startswith=PREFIX)
+        self.viewer = users.order_by("following_count", "id")[users.count() // 2]
+        self.celebrity = users.order_by("-follower_count", "id").first()
+        self.others = list(users.exclude(pk=self.viewer.pk).order_by("id").values_list("id", "username")[:100])
+        self.tweet_ids = list(Tweet.objects.order_by("-created_at", "-id").values_list("id", flat=True)[:100])
+        self.client = Client()
+        self.client.force_login(self.viewer)
+        self.anonymous = Client()
+        self.signups = 0
+
+    def measure(self, url_name, scenario, requests):
+        scenario = getattr(self, f"scenario_{scenario}")
+
+        def send(i):
+            client, method, url, data = scenario(url_name, i)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                elapsed = time.perf_counter() - started
+            return response.status_code, elapsed, len(queries)
+
+        # 1回目はキャッシュを温めるだけ，最後の1回は tracemalloc を有効にしてメモリだけを測る
+        send(0)
+        samples = [send(i) for i in range(1, requests + 1)]
+        tracemalloc.start()
+        try:
+            send(requests + 1)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        statuses, latencies, query_counts = zip(*samples)
+        p50, p95, p99 = percentiles_ms(latencies, 50, 95, 99)
+        return {
+            "url_name": url_name,
+            "status": {str(status): statuses.count(status) for status in sorted(set(statuses))},
+            "errors": sum(status >= 400 for status in statuses),
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "queries_mean": round(statistics.mean(query_counts), 2),
+            "queries_max": max(query_counts),
+            "peak_memory_kib": round(peak / 1024, 1),
+        }
+
+    def report(self, routes, baseline_path):
+        baseline = {}
+        if baseline_path:
+            with open(baseline_path) as f:
+                baseline = json.load(f)["routes"]
+        for label, row in routes.items():
+            line = (
+                f"{label:<26} p50 {row['p50_ms']:8.2f} ms  p95 {row['p95_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms  "
+                f"queries {row['queries_mean']:6.2f}  peak {row['peak_memory_kib']:8.1f} KiB  errors {row['errors']}"
+            )
+            if label in baseline:
+                before = baseline[label]
+                line += (
+                    f"  (p95 {row['p95_ms'] - before['p95_ms']:+.2f} ms, "
+                    f"queries {row['queries_mean'] - before['queries_mean']:+.2f})"
+                )
+            self.stdout.write(line)
+
+    def pick(self, values, i):
+        return values[i % len(values)]
+
+    def scenario_home(self, url_name, i):
+        return self.client, "get", reverse(url_name), None
+
+    def scenario_like_states(self, url_name, i):
+        return self.client, "get", reverse(url_name), {"ids": ",".join(map(str, self.tweet_ids[:20]))}
+
+    def scenario_create_form(self, url_name, i):
+        return self.client, "get", reverse(url_name), None
+
+    def scenario_create(self, url_name, i):
+        return self.client, "post", reverse(url_name), {"content": f"benchmark tweet {i}"}
+
+    def scenario_detail(self, url_name, i):
+        return self.client, "get", reverse(url_name, kwargs={"pk": self.pick(self.tweet_ids, i)}), None
+
+    def scenario_delete_form(self, url_name, i):
+        tweet = Tweet.objects.create(user=self.viewer, content=f"to delete {i}")
+        return self.client, "get", reverse(url_name, kwargs={"pk": tweet.pk}), None
+
+    def scenario_delete(self, url_name, i):
+        tweet = Tweet.objects.create(user=self.viewer, content=f"to delete {i}")
+        return self.client, "post", reverse(url_name, kwargs={"pk": tweet.pk}), None
+
+    def scenario_like(self, url_name, i):
+        tweet_id = self.pick(self.tweet_ids, i)
+        if Like.objects.filter(user=self.viewer, tweet_id=tweet_id).exists():
+            likes.unlike(self.viewer.id, tweet_id)
+        return self.client, "post", reverse(url_name, kwargs={"pk": tweet_id}), None
+
+    def scenario_unlike(self, url_name, i):
+        tweet_id = self.pick(self.tweet_ids, i)
+        likes.like(self.viewer.id, tweet_id)
+        return self.client, "post", reverse(url_name, kwargs={"pk": tweet_id}), None
+
+    def scenario_signup_form(self, url_name, i):
+        return self.anonymous, "get", reverse(url_name), None
+
+    def scenario_signup(self, url_name, i):
+        self.anonymous.logout()
+        self.signups += 1
+        username = f"signup{self.signups}"
+        data = {
+            "username": username,
+            "email": f"{username}@example.com",
+            "password1": SIGNUP_PASSWORD,
+            "password2": SIGNUP_PASSWORD,
+        }
+        return self.anonymous, "post", reverse(url_name), data
+
+    def scenario_login_form(self, url_name, i):
+        self.anonymous.logout()
+        return self.anonymous, "get", reverse(url_name), None
+
+    def scenario_login(self, url_name, i):
+        self.anonymous.logout()
+        return self.anonymous, "post", reverse(url_name), {"username": self.viewer.username, "password": PASSWORD}
+
+    def scenario_logout(self, url_name, i):
+        self.anonymous.force_login(self.viewer)
+        return self.anonymous, "post", reverse(url_name), None
+
+    def scenario_user_profile(self, url_name, i):
+        return self.client, "get", reverse(url_name, kwargs={"username": self.celebrity.username}), None
+
+    def scenario_follow(self, url_name, i):
+        user_id, username = self.pick(self.others, i)
+        unfollow(self.viewer.pk, user_id)
+        return self.client, "post", reverse(url_name, kwargs={"username": username}), None
+
+    def scenario_unfollow(self, url_name, i):
+        user_id, username = self.pick(self.others, i)
+        FriendShip.objects.get_or_create(follower=self.viewer, followee_id=user_id)
+        return self.client, "post", reverse(url_name, kwargs={"username": username}), None
+
+    def scenario_follow_list(self, url_name, i):
+        return self.client, "get", reverse(url_name, kwargs={"username": self.celebrity.username}), None
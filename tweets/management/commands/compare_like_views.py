@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.urls import reverse
+
+from accounts.models import User
+from mysite.benchmark import benchmark_databases, percentiles_ms
+from tweets.models import Tweet
+
+ENDPOINTS = {
+    "sync": ("tweets:like", "tweets:unlike"),
+    "async": ("tweets:async_like", "tweets:async_unlike"),
+}
+
+
+class Command(BaseCommand):
+    help = "ASGIアプリケーションに対して同期版と非同期版のいいねAPIへ負荷をかけ，秒間リクエスト数とp99レイテンシを比較します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=50)
+
+    def handle(self, *args, **options):
+        with benchmark_databases():
+            user = User.objects.create_user(username="loadtest")
+            tweet = Tweet.objects.create(user=user, content="loadtest")
+            for label, (like_name, unlike_name) in ENDPOINTS.items():
+                self.compare(
+                    label,
+                    user,
+                    [reverse(name, kwargs={"pk": tweet.id}) for name in (like_name, unlike_name)],
+                    options,
+                )
+
+    def compare(self, label, user, urls, options):
+        client = AsyncClient()
+        client.force_login(user)
+        latencies, elapsed, errors = asyncio.run(
+            self.run_load(client, urls, options["requests"], options["concurrency"])
+        )
+        p50, p99 = percentiles_ms(latencies, 50, 99)
+        self.stdout.write(
+            f"{label:>5}: {len(latencies) / elapsed:8.1f} req/s  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  errors {errors}"
+        )
+
+    async def run_load(self, client, urls, total, concurrency):
+        latencies = []
+        errors = 0
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(urls[i % len(urls)])
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                url = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.post(url)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, time.perf_counter() - started, errors
@@ -0,0 +1,183 @@
+import random
+import time
+from array import array
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import FriendShip, User
+from tweets.models import Like, TimelineEntry, Tweet
+
+# フォロー数・いいね数はパレート分布，フォローされやすさは順位のべき乗(Zipf)に従わせる
+DEGREE_ALPHA = 2.0
+POPULARITY_EXPONENT = 1.0
+
+FAN_OUT_SQL = f"""
+INSERT INTO {TimelineEntry._meta.db_table} (user_id, tweet_id, author_id, created_at)
+SELECT t.user_id, t.id, t.user_id, t.created_at
+FROM {Tweet._meta.db_table} t
+WHERE t.id BETWEEN %s AND %s
+UNION ALL
+SELECT f.follower_id, t.id, t.user_id, t.created_at
+FROM {Tweet._meta.db_table} t
+JOIN {FriendShip._meta.db_table} f ON f.followee_id = t.user_id
+JOIN {User._meta.db_table} u ON u.id = t.user_id
+WHERE t.id BETWEEN %s AND %s AND NOT u.is_pull_author
+ORDER BY 1, 2
+"""
+
+
+def insert_rows(model, field_names, rows):
+    # auto_now_add は bulk_create でも現在時刻で上書きするので，created_at を指定したい行は直接 INSERT する
+    fields = [model._meta.get_field(name) for name in field_names]
+    quote = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(quote(field.column) for field in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            sql, [[field.get_db_prep_save(value, connection) for field, value in zip(fields, row)] for row in rows]
+        )
+
+
+def pareto(rng, mean, limit):
+    # 平均がおよそ mean になるようにしたパレート分布の整数
+    return min(limit, int(rng.paretovariate(DEGREE_ALPHA) * mean * (DEGREE_ALPHA - 1) / DEGREE_ALPHA))
+
+
+class Command(BaseCommand):
+    help = "負荷試験用に，ユーザー・フォロー関係(べき分布)・ツイート・いいねを bulk_create でまとめて生成します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--tweets", type=int, default=10000)
+        parser.add_argument("--follows", type=int, default=20, help="1人あたりの平均フォロー数")
+        parser.add_argument("--likes", type=int, default=50000, help="いいねの総数の目安")
+        parser.add_argument("--days", type=int, default=30, help="ツイートを散らばらせる日数")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="load")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--no-timelines", action="store_true", help="タイムラインへのファンアウトを省く")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options["prefix"]).exists():
+            raise CommandError(
+                f"ユーザー名が {options['prefix']} で始まるユーザーが既にいます。--prefix を変えてください"
+            )
+        if options["users"] < 2:
+            raise CommandError("--users は2以上にしてください")
+
+        self.batch_size = options["batch_size"]
+        self.end = timezone.now()
+        self.start = self.end - timedelta(days=options["days"])
+        user_ids = self.step("users", self.create_users, options)
+        self.step("follows", self.create_follows, user_ids, options)
+        self.step("counts", self.update_counts)
+        first_id, last_id = self.step("tweets+likes", self.create_tweets, user_ids, options)
+        if not options["no_timelines"] and first_id is not None:
+            self.step("timelines", self.fan_out, first_id, last_id)
+
+        self.stdout.write(self.style.SUCCESS(f"{options['prefix']}* のデータを生成しました"))
+
+    def step(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f"{label}: {time.perf_counter() - started:.1f}s")
+        return result
+
+    def create_users(self, options):
+        # パスワードのハッシュは全員で使い回す(password)
+        password = make_password("password")
+        user_ids = array("q")
+        for offset in range(0, options["users"], self.batch_size):
+            users = [
+                User(
+                    username=f"{options['prefix']}{i}", email=f"{options['prefix']}{i}@example.com", password=password
+                )
+                for i in range(offset, min(offset + self.batch_size, options["users"]))
+            ]
+            user_ids.extend(user.pk for user in User.objects.bulk_create(users))
+        return user_ids
+
+    def create_follows(self, user_ids, options):
+        rng = random.Random(f"{options['seed']}-follows")
+        count = len(user_ids)
+        cum_weights = list(accumulate(1 / (rank + 1) ** POPULARITY_EXPONENT for rank in range(count)))
+        total = cum_weights[-1]
+        span = (self.end - self.start).total_seconds()
+
+        batch = []
+        for follower in range(count):
+            degree = pareto(rng, options["follows"], count - 1)
+            followees = set()
+            for _ in range(degree * 4):
+                if len(followees) >= degree:
+                    break
+                followee = bisect(cum_weights, rng.random() * total)
+                if followee != follower:
+                    followees.add(followee)
+            for followee in sorted(followees):
+                created_at = self.start - timedelta(seconds=rng.random() * span)
+                batch.append((user_ids[follower], user_ids[followee], created_at))
+            if len(batch) >= self.batch_size:
+                insert_rows(FriendShip, ["follower", "followee", "created_at"], batch)
+                batch = []
+        insert_rows(FriendShip, ["follower", "followee", "created_at"], batch)
+
+    def update_counts(self):
+        # フォロー数は FriendShip から数え直し，フォロワー数の多いユーザーは読み込み時マージ(pull)にする
+        call_command("reconcile_follow_counts", stdout=self.stdout)
+        call_command("reclassify_timeline_authors", stdout=self.stdout)
+
+    def create_tweets(self, user_ids, options):
+        rng = random.Random(f"{options['seed']}-tweets")
+        count = options["tweets"]
+        span = self.end - self.start
+        mean_likes = options["likes"] / max(count, 1)
+        first_id = last_id = None
+
+        for offset in range(0, count, self.batch_size):
+            tweets = []
+            like_counts = []
+            created_ats = []
+            for i in range(offset, min(offset + self.batch_size, count)):
+                like_count = pareto(rng, mean_likes, len(user_ids))
+                like_counts.append(like_count)
+                created_ats.append(self.start + span * i / count)
+                tweets.append(
+                    Tweet(
+                        user_id=user_ids[rng.randrange(len(user_ids))],
+                        content=f"load test tweet {i}",
+                        like_count=like_count,
+                    )
+                )
+            with transaction.atomic():
+                # IDが要るので bulk_create で入れ，auto_now_add が入れた現在時刻を続く UPDATE で書き換える
+                tweets = Tweet.objects.bulk_create(tweets)
+                for tweet, created_at in zip(tweets, created_ats):
+                    tweet.created_at = created_at
+                Tweet.objects.bulk_update(tweets, ["created_at"])
+                likes = [
+                    (user_ids[liker], tweet.pk, tweet.created_at + timedelta(seconds=rng.randrange(3600)))
+                    for tweet, like_count in zip(tweets, like_counts)
+                    for liker in rng.sample(range(len(user_ids)), like_count)
+                ]
+                insert_rows(Like, ["user", "tweet", "created_at"], likes)
+            first_id = tweets[0].pk if first_id is None else first_id
+            last_id = tweets[-1].pk
+        return first_id, last_id
+
+    def fan_out(self, first_id, last_id):
+        # 本人とフォロワー(push のユーザーのみ)のタイムラインへ，ツイートIDの範囲ごとにまとめて入れる
+        # (user_id, tweet_id) 順に並べて入れると，user_id が先頭のインデックスへの書き込みがまとまって速い
+        for low in range(first_id, last_id + 1, self.batch_size):
+            high = min(low + self.batch_size - 1, last_id)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(FAN_OUT_SQL, [low, high, low, high])
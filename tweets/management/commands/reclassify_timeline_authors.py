@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import User
+from tweets import timeline
+
+
+class Command(BaseCommand):
+    help = "フォロワー数に応じて，ファンアウト(push)と読み込み時マージ(pull)を切り替えます"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=int, default=None)
+
+    def handle(self, *args, **options):
+        threshold = options["threshold"] or settings.TIMELINE_PULL_THRESHOLD
+        to_pull = User.objects.filter(follower_count__gte=threshold, is_pull_author=False)
+        to_push = User.objects.filter(follower_count__lt=threshold, is_pull_author=True)
+
+        pulled = pushed = 0
+        for user in to_pull.iterator():
+            with transaction.atomic():
+                timeline.switch_to_pull(user)
+            pulled += 1
+        for user in to_push.iterator():
+            with transaction.atomic():
+                timeline.switch_to_push(user)
+            pushed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"pull: {pulled}人, push: {pushed}人を切り替えました"))
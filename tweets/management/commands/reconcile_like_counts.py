@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from tweets.models import Like, Tweet
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Tweet.like_count を Like テーブルの件数と照合し，ずれていれば修正します"
+
+    def handle(self, *args, **options):
+        counts = (
+            Like.objects.filter(tweet=OuterRef("pk")).order_by().values("tweet").annotate(c=Count("id")).values("c")
+        )
+        drifted = (
+            Tweet.objects.annotate(actual=Coalesce(Subquery(counts), 0))
+            .exclude(like_count=F("actual"))
+            .only("id", "like_count")
+        )
+
+        fixed = []
+        total = 0
+        for tweet in drifted.iterator(chunk_size=BATCH_SIZE):
+            tweet.like_count = tweet.actual
+            fixed.append(tweet)
+            if len(fixed) >= BATCH_SIZE:
+                Tweet.objects.bulk_update(fixed, ["like_count"])
+                total += len(fixed)
+                fixed = []
+        Tweet.objects.bulk_update(fixed, ["like_count"])
+        total += len(fixed)
+
+        self.stdout.write(self.style.SUCCESS(f"{total}件のいいね数を修正しました"))
@@ -0,0 +1,68 @@
+# Generated by Django 4.1.13 on 2026-10-17 16:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_timelines(apps, schema_editor):
+    Tweet = apps.get_model("tweets", "Tweet")
+    TimelineEntry = apps.get_model("tweets", "TimelineEntry")
+    FriendShip = apps.get_model("accounts", "FriendShip")
+
+    for tweet in Tweet.objects.iterator():
+        user_ids = [tweet.user_id, *FriendShip.objects.filter(followee_id=tweet.user_id).values_list("follower_id", flat=True)]
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, tweet_id=tweet.id, author_id=tweet.user_id, created_at=tweet.created_at)
+                for user_id in user_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("accounts", "0003_friendship_friendship_unique_friendship"),
+        ("tweets", "0003_like_like_unique_like"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField()),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="timeline_entries", to="tweets.tweet"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="timelineentry",
+            index=models.Index(fields=["user", "-created_at", "-tweet"], name="timeline_user_created_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="timelineentry",
+            constraint=models.UniqueConstraint(fields=("user", "tweet"), name="unique_timeline_entry"),
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-17 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0005_tweet_like_count"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(fields=["user", "-created_at", "-id"], name="tweet_user_created_idx"),
+        ),
+    ]
@@ -9,12 +9,14 @@ class Tweet(models.Model):
     content = models.TextField(max_length=140)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    like_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.content
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "-created_at", "-id"], name="tweet_user_created_idx")]
 
 
 class Like(models.Model):
@@ -24,3 +26,14 @@ class Like(models.Model):
 
     class Meta:
         constraints = [UniqueConstraint(fields=["user", "tweet"], name="unique_like")]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="timeline_entries", on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, related_name="timeline_entries", on_delete=models.CASCADE)
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [UniqueConstraint(fields=["user", "tweet"], name="unique_timeline_entry")]
+        indexes = [models.Index(fields=["user", "-created_at", "-tweet"], name="timeline_user_created_idx")]
@@ -0,0 +1,120 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        created_at, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except ValueError as e:
+        raise InvalidCursor(token) from e
+
+
+def keyset_filter(queryset, cursor, created_field="created_at", pk_field="id"):
+    # (created_at, id) の組で「カーソルより古い」行だけに絞る。OFFSETは使わない
+    created_at, pk = cursor
+    return queryset.filter(
+        Q(**{f"{created_field}__lt": created_at}) | Q(**{created_field: created_at, f"{pk_field}__lt": pk})
+    )
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class StreamingCursorPage:
+    # object_list を読み進めながら返し，読み切った時点で next_cursor が決まる
+    def __init__(self, queryset, per_page, chunk_size, created_field, pk_field):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.chunk_size = chunk_size
+        self.created_field = created_field
+        self.pk_field = pk_field
+        self.next_cursor = None
+
+    @property
+    def object_list(self):
+        last = None
+        for i, obj in enumerate(self.queryset[: self.per_page + 1].iterator(chunk_size=self.chunk_size)):
+            if i == self.per_page:
+                self.next_cursor = encode_cursor(getattr(last, self.created_field), getattr(last, self.pk_field))
+                return
+            last = obj
+            yield obj
+
+
+class CursorPaginator:
+    def __init__(self, queryset, per_page, created_field="created_at", pk_field="id"):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.created_field = created_field
+        self.pk_field = pk_field
+
+    def ordered(self, token=None):
+        queryset = self.queryset.order_by(f"-{self.created_field}", f"-{self.pk_field}")
+        if token:
+            queryset = keyset_filter(queryset, decode_cursor(token), self.created_field, self.pk_field)
+        return queryset
+
+    def window(self, token=None):
+        # ページに載る行(次ページの判定に使う1件を含む)。読み込まずにサブクエリとして集計に使う
+        return self.ordered(token)[: self.per_page + 1]
+
+    def page(self, token=None):
+        queryset = self.ordered(token)
+
+        # 1件多く取得して次ページの有無を判定する
+        object_list = list(queryset[: self.per_page + 1])
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[: self.per_page]
+            last = object_list[-1]
+            next_cursor = encode_cursor(getattr(last, self.created_field), getattr(last, self.pk_field))
+        return CursorPage(object_list, next_cursor)
+
+    def stream_page(self, token=None, chunk_size=100):
+        return StreamingCursorPage(self.ordered(token), self.per_page, chunk_size, self.created_field, self.pk_field)
+
+
+class CursorPaginationMixin:
+    page_size = 20
+    cursor_kwarg = "cursor"
+    next_cursor = None
+
+    def get_cursor(self):
+        return self.request.GET.get(self.cursor_kwarg)
+
+    def paginate_by_cursor(self, queryset, **kwargs):
+        return self.paginate(CursorPaginator(queryset, self.page_size, **kwargs))
+
+    def paginate(self, paginator):
+        try:
+            page = paginator.page(self.get_cursor())
+        except InvalidCursor:
+            raise Http404("無効なページです")
+        self.next_cursor = page.next_cursor
+        return page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["next_cursor"] = self.next_cursor
+        return context
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import FriendShip
+
+from . import cards, live, timeline
+from .models import Tweet
+
+
+@receiver(post_save, sender=Tweet)
+def fan_out_new_tweet(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out_tweet(instance)
+        live.publish_tweet(instance)
+
+
+@receiver(post_save, sender=Tweet)
+@receiver(post_delete, sender=Tweet)
+def invalidate_card(sender, instance, **kwargs):
+    cards.invalidate(instance.id)
+
+
+@receiver(post_save, sender=FriendShip)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance)
+
+
+@receiver(post_delete, sender=FriendShip)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance)
@@ -0,0 +1,52 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import cards
+from .counters import like_counter
+from .pagination import InvalidCursor
+
+FEED_MARKER = mark_safe("<!-- feed -->")
+NEXT_LINK_TEMPLATE = "tweets/next_link.html"
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class StreamingFeedMixin:
+    # FEED_STREAMING が有効なら，ページの前後を先に描画し，ツイートカードはDBから読み進めながら順に送る
+    # ビューは object_list を遅延評価するページ(next_cursor は読み切った後に決まってよい)を返す
+    @property
+    def streaming(self):
+        # Django 4.1 の ASGIHandler はストリーミングの中身をイベントループ上で読むので(DBに触れない)，ASGIではまとめて描画する
+        return settings.FEED_STREAMING["ENABLED"] and not isinstance(self.request, ASGIRequest)
+
+    def get_streaming_page(self):
+        raise NotImplementedError
+
+    def render_to_response(self, context, **response_kwargs):
+        if not self.streaming:
+            return super().render_to_response(context, **response_kwargs)
+        try:
+            page = self.get_streaming_page()
+        except InvalidCursor:
+            raise Http404("無効なページです")
+        html = render_to_string(self.get_template_names(), {**context, "feed_marker": FEED_MARKER}, self.request)
+        head, tail = html.split(FEED_MARKER)
+        return StreamingHttpResponse(self.stream_feed(head, page, tail))
+
+    def stream_feed(self, head, page, tail):
+        yield head
+        for tweets in chunked(page.object_list, settings.FEED_STREAMING["CHUNK_SIZE"]):
+            like_counter.apply_pending(tweets)
+            cards.render_cards(tweets)
+            yield "".join(tweet.card for tweet in tweets)
+        yield render_to_string(NEXT_LINK_TEMPLATE, {"next_cursor": page.next_cursor})
+        yield tail
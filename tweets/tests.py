@@ -1,9 +1,70 @@
-from django.test import TestCase
+import json
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.parse import unquote
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import F, Sum
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
+from accounts.follows import unfollow
 from accounts.forms import User
+from accounts.graph import follow_graph
+from accounts.models import FriendShip
+from mysite.routers import PINNED_UNTIL_SESSION_KEY
+from mysite.sqlite3.base import DatabaseWrapper as TunedSQLiteWrapper
+from mysite.warmup import warm_templates
+
+from . import cards, live
+from .context_processors import live_updates
+from .counters import like_counter
+from .management.commands import bench_urls
+from .models import Like, TimelineEntry, Tweet
+from .views import HomeView, LikeStateView
+
+# セッション + ユーザー取得の2クエリに加えて，PostgreSQLは1文，SQLiteはセーブポイントと2文
+LIKE_QUERY_BUDGET = 3 if connection.vendor == "postgresql" else 6
+
 
-from .models import Like, Tweet
+def sqlite_plan_problems(cursor, sql, params):
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    return [
+        detail
+        for _, _, _, detail in cursor.fetchall()
+        if "TEMP B-TREE" in detail or (detail.startswith("SCAN") and "INDEX" not in detail)
+    ]
+
+
+def postgresql_plan_problems(cursor, sql, params):
+    # テストの小さな表ではSeq Scanが選ばれやすいので，使えるインデックスがあるかだけを見る
+    cursor.execute("SET LOCAL enable_seqscan = off")
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+    plan = cursor.fetchone()[0]
+    nodes = json.loads(plan) if isinstance(plan, str) else plan
+    problems = []
+    while nodes:
+        node = nodes.pop()
+        node = node.get("Plan", node)
+        if node["Node Type"] in ("Seq Scan", "Sort"):
+            problems.append(f'{node["Node Type"]} on {node.get("Relation Name", "-")}')
+        nodes.extend(node.get("Plans", []))
+    return problems
 
 
 class BaseTestCase(TestCase):
@@ -27,6 +88,117 @@ class TestHomeView(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "tweets/home.html")
 
+    def test_success_get_with_cursor(self):
+        for i in range(HomeView.page_size + 5):
+            Tweet.objects.create(user=self.user, content=f"tweet{i}")
+        tweets = list(Tweet.objects.order_by("-created_at", "-id"))
+
+        response = self.client.get(self.url)
+        first_page = response.context["tweet_list"]
+        next_cursor = response.context["next_cursor"]
+        self.assertEqual(first_page, tweets[: HomeView.page_size])
+        self.assertIsNotNone(next_cursor)
+
+        response = self.client.get(self.url, {"cursor": next_cursor})
+        self.assertEqual(response.context["tweet_list"], tweets[HomeView.page_size :])
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestHomeTimeline(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("tweets:home")
+        self.followee = User.objects.create_user(username="followee", password="testpass")
+        self.stranger = User.objects.create_user(username="stranger", password="testpass")
+        self.followee_tweet = Tweet.objects.create(user=self.followee, content="followee")
+        Tweet.objects.create(user=self.stranger, content="stranger")
+
+    def test_success_get_with_followee_tweets(self):
+        self.client.post(reverse("accounts:follow", kwargs={"username": "followee"}))
+        new_tweet = Tweet.objects.create(user=self.followee, content="new")
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context["tweet_list"], [new_tweet, self.followee_tweet, self.tweet])
+
+    def test_success_get_after_unfollow(self):
+        FriendShip.objects.create(follower=self.user, followee=self.followee)
+        self.client.post(reverse("accounts:unfollow", kwargs={"username": "followee"}))
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context["tweet_list"], [self.tweet])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user, author=self.followee).exists())
+
+    def test_success_get_after_delete(self):
+        FriendShip.objects.create(follower=self.user, followee=self.followee)
+        self.followee_tweet.delete()
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context["tweet_list"], [self.tweet])
+
+
+@override_settings(TIMELINE_PULL_THRESHOLD=2)
+class TestHybridTimeline(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("tweets:home")
+        self.celebrity = User.objects.create_user(username="celebrity", password="testpass")
+        self.fan = User.objects.create_user(username="fan", password="testpass")
+        self.old_tweet = Tweet.objects.create(user=self.celebrity, content="old")
+        FriendShip.objects.create(follower=self.user, followee=self.celebrity)
+        FriendShip.objects.create(follower=self.fan, followee=self.celebrity)
+
+    def test_reclassify_to_pull(self):
+        call_command("reclassify_timeline_authors", stdout=StringIO())
+        self.celebrity.refresh_from_db()
+        new_tweet = Tweet.objects.create(user=self.celebrity, content="new")
+        response = self.client.get(self.url)
+
+        self.assertTrue(self.celebrity.is_pull_author)
+        self.assertFalse(TimelineEntry.objects.filter(author=self.celebrity).exclude(user=self.celebrity).exists())
+        self.assertEqual(response.context["tweet_list"], [new_tweet, self.old_tweet, self.tweet])
+
+    @override_settings(FOLLOW_GRAPH={"ENABLED": True, "MAX_USERS": 10, "TIMEOUT": 60})
+    def test_pull_authors_from_follow_graph(self):
+        follow_graph.clear()
+        self.addCleanup(follow_graph.clear)
+        call_command("reclassify_timeline_authors", stdout=StringIO())
+        new_tweet = Tweet.objects.create(user=self.celebrity, content="new")
+        with mock.patch.object(follow_graph, "filter_followed", wraps=follow_graph.filter_followed) as filter_followed:
+            response = self.client.get(self.url)
+
+        filter_followed.assert_called_once()
+        self.assertEqual(response.context["tweet_list"], [new_tweet, self.old_tweet, self.tweet])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            unfollow(self.user.pk, self.celebrity.pk)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["tweet_list"], [self.tweet])
+
+    def test_reclassify_to_push(self):
+        call_command("reclassify_timeline_authors", stdout=StringIO())
+        unfollow(self.fan.pk, self.celebrity.pk)
+        call_command("reclassify_timeline_authors", stdout=StringIO())
+        self.celebrity.refresh_from_db()
+
+        self.assertFalse(self.celebrity.is_pull_author)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, tweet=self.old_tweet).exists())
+
+    def test_success_get_with_cursor(self):
+        call_command("reclassify_timeline_authors", stdout=StringIO())
+        for i in range(HomeView.page_size):
+            Tweet.objects.create(user=self.celebrity if i % 2 else self.user, content=f"tweet{i}")
+        tweets = list(Tweet.objects.filter(user__in=[self.user, self.celebrity]).order_by("-created_at", "-id"))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["tweet_list"], tweets[: HomeView.page_size])
+
+        response = self.client.get(self.url, {"cursor": response.context["next_cursor"]})
+        self.assertEqual(response.context["tweet_list"], tweets[HomeView.page_size :])
+
 
 class TestTweetCreateView(BaseTestCase):
     def setUp(self):
@@ -85,6 +257,33 @@ class TestTweetDetailView(BaseTestCase):
         self.assertEqual(test_tweet, self.tweet)
         self.assertEqual(response.status_code, 200)
 
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        # セッション + ユーザー取得の2クエリとETagの1クエリ
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_modified_after_like(self):
+        etag = self.client.get(self.url)["ETag"]
+        another = User.objects.create_user(username="another", password="testpass")
+        Like.objects.create(user=another, tweet=self.tweet)
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_depends_on_viewer(self):
+        etag = self.client.get(self.url)["ETag"]
+        User.objects.create_user(username="another", password="testpass")
+        self.client.login(username="another", password="testpass")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+
 
 class TestTweetDeleteView(BaseTestCase):
     def setUp(self):
@@ -135,6 +334,9 @@ class TestLikeView(BaseTestCase):
 
         self.assertEqual(Like.objects.count(), first_count + 1)
         self.assertEqual(response.status_code, 200)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 1)
+        self.assertEqual(response.json()["liked_count"], 1)
 
     def test_failure_post_with_not_exist_tweet(self):
         self.url = reverse("tweets:like", kwargs={"pk": self.tweet.pk + 1})
@@ -152,6 +354,24 @@ class TestLikeView(BaseTestCase):
 
         self.assertEqual(Like.objects.count(), first_count)
         self.assertEqual(response.status_code, 200)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 1)
+
+    def test_success_post_within_query_budget(self):
+        self.url = reverse("tweets:like", kwargs={"pk": self.tweet.pk})
+        with self.assertNumQueries(LIKE_QUERY_BUDGET):
+            response = self.client.post(self.url)
+
+        self.assertEqual(response.json()["liked_count"], 1)
+
+    def test_success_post_without_returning(self):
+        self.url = reverse("tweets:like", kwargs={"pk": self.tweet.pk})
+        with mock.patch("tweets.likes._supports_returning", return_value=False):
+            response = self.client.post(self.url)
+            self.client.post(self.url)
+
+        self.assertEqual(response.json()["liked_count"], 1)
+        self.assertEqual(Like.objects.count(), 1)
 
 
 class TestUnLikeView(BaseTestCase):
@@ -166,6 +386,9 @@ class TestUnLikeView(BaseTestCase):
 
         self.assertEqual(Like.objects.count(), first_count - 1)
         self.assertEqual(response.status_code, 200)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 0)
+        self.assertEqual(response.json()["liked_count"], 0)
 
     def test_failure_post_with_not_exist_tweet(self):
         self.url = reverse("tweets:unlike", kwargs={"pk": self.tweet.pk + 1})
@@ -175,6 +398,13 @@ class TestUnLikeView(BaseTestCase):
         self.assertEqual(Like.objects.count(), first_count)
         self.assertEqual(response.status_code, 404)
 
+    def test_success_post_within_query_budget(self):
+        self.url = reverse("tweets:unlike", kwargs={"pk": self.tweet.pk})
+        with self.assertNumQueries(LIKE_QUERY_BUDGET):
+            response = self.client.post(self.url)
+
+        self.assertEqual(response.json()["liked_count"], 0)
+
     def test_failure_post_with_unliked_tweet(self):
         self.url = reverse("tweets:unlike", kwargs={"pk": self.tweet.pk})
         response = self.client.post(self.url)
@@ -183,3 +413,621 @@ class TestUnLikeView(BaseTestCase):
 
         self.assertEqual(Like.objects.count(), first_count)
         self.assertEqual(response.status_code, 200)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 0)
+
+
+class TestAsyncLikeView(BaseTestCase):
+    def test_success_post(self):
+        response = self.client.post(reverse("tweets:async_like", kwargs={"pk": self.tweet.pk}))
+        self.client.post(reverse("tweets:async_like", kwargs={"pk": self.tweet.pk}))
+        self.tweet.refresh_from_db()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["liked_count"], 1)
+        self.assertEqual(self.tweet.like_count, 1)
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_success_post_unlike(self):
+        Like.objects.create(user=self.user, tweet=self.tweet)
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=1)
+        response = self.client.post(reverse("tweets:async_unlike", kwargs={"pk": self.tweet.pk}))
+        self.client.post(reverse("tweets:async_unlike", kwargs={"pk": self.tweet.pk}))
+        self.tweet.refresh_from_db()
+
+        self.assertEqual(response.json()["liked_count"], 0)
+        self.assertEqual(self.tweet.like_count, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_failure_post_with_not_exist_tweet(self):
+        response = self.client.post(reverse("tweets:async_like", kwargs={"pk": self.tweet.pk + 1}))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Like.objects.exists())
+
+    def test_failure_post_without_login(self):
+        self.client.logout()
+        response = self.client.post(reverse("tweets:async_like", kwargs={"pk": self.tweet.pk}))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Like.objects.exists())
+
+
+class TestLikeStateView(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("tweets:like_states")
+        self.another = Tweet.objects.create(user=self.user, content="another")
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+
+    def test_success_get(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {"ids": f"{self.tweet.pk},{self.another.pk}"})
+        states = {state["tweet_id"]: state for state in response.json()["tweets"]}
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(states[self.tweet.pk], {"tweet_id": self.tweet.pk, "liked_count": 1, "is_liked": True})
+        self.assertEqual(states[self.another.pk], {"tweet_id": self.another.pk, "liked_count": 0, "is_liked": False})
+
+    def test_failure_get_with_invalid_ids(self):
+        response = self.client.get(self.url, {"ids": "a,b"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_get_with_too_many_ids(self):
+        ids = ",".join(str(i) for i in range(LikeStateView.max_ids + 1))
+        response = self.client.get(self.url, {"ids": ids})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_passes_url_and_max_ids(self):
+        response = self.client.get(reverse("tweets:home"))
+
+        self.assertContains(
+            response, f'data-like-states-url="{self.url}" data-like-states-max-ids="{LikeStateView.max_ids}"'
+        )
+
+
+class TestTweetCards(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.another_user = User.objects.create_user(username="another", password="testpass")
+        Like.objects.create(user=self.user, tweet=self.tweet)
+        Tweet.objects.filter(pk=self.tweet.pk).update(like_count=1)
+        self.tweet.refresh_from_db()
+
+    def test_render_from_cache(self):
+        cards.render_cards([self.tweet])
+        with mock.patch("tweets.cards.get_template") as get_template:
+            cards.render_cards([self.tweet])
+
+        get_template.assert_not_called()
+        self.assertIsNotNone(cache.get(cards.cache_key(self.tweet.pk)))
+
+    def test_like_button_depends_on_viewer(self):
+        self.tweet.is_liked = [True]
+        liked_card = cards.render_cards([self.tweet])[0].card
+        self.tweet.is_liked = []
+        unliked_card = cards.render_cards([self.tweet])[0].card
+
+        self.assertIn("いいね解除", liked_card)
+        self.assertNotIn("いいね解除", unliked_card)
+        self.assertIn(self.tweet.content, unliked_card)
+
+    def test_invalidate_on_save_and_delete(self):
+        cards.render_cards([self.tweet])
+        self.tweet.content = "edited"
+        self.tweet.save()
+        self.assertIsNone(cache.get(cards.cache_key(self.tweet.pk)))
+        self.assertIn("edited", cards.render_cards([self.tweet])[0].card)
+
+        self.tweet.delete()
+        self.assertIsNone(cache.get(cards.cache_key(self.tweet.pk)))
+
+    def test_rerender_on_like_count_change(self):
+        cards.render_cards([self.tweet])
+        self.client.login(username="another", password="testpass")
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.tweet.refresh_from_db()
+        card = cards.render_cards([self.tweet])[0].card
+
+        self.assertIn('class="count">2</span>', card)
+
+    def test_like_button_url(self):
+        with mock.patch("tweets.cards.reverse", wraps=reverse) as mocked:
+            buttons = [cards.render_like_button(tweet, False) for tweet in (self.tweet, self.tweet)]
+            button = cards.render_like_button(self.tweet, True)
+
+        self.assertLessEqual(mocked.call_count, 2)
+        self.assertIn(f'data-url="{reverse("tweets:like", kwargs={"pk": self.tweet.pk})}"', buttons[0])
+        self.assertIn(f'data-url="{reverse("tweets:unlike", kwargs={"pk": self.tweet.pk})}"', button)
+
+    def test_warm_templates(self):
+        with mock.patch("mysite.warmup.get_template") as get_template:
+            count = warm_templates()
+
+        self.assertEqual(count, get_template.call_count)
+        get_template.assert_any_call("tweets/home.html")
+        get_template.assert_any_call("tweets/card.html")
+
+
+@override_settings(LIKE_COUNTER_BUFFER={"ENABLED": True, "MAX_PENDING": 100, "FLUSH_INTERVAL": 60})
+class TestLikeCounterBuffer(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(like_counter.flush)
+
+    def test_success_post_with_buffer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.tweet.refresh_from_db()
+
+        self.assertEqual(self.tweet.like_count, 0)
+        self.assertEqual(like_counter.pending(self.tweet.pk), 1)
+
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.context["tweet"].like_count, 1)
+
+        like_counter.flush()
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 1)
+        self.assertEqual(like_counter.pending(self.tweet.pk), 0)
+
+    @override_settings(LIKE_COUNTER_BUFFER={"ENABLED": True, "MAX_PENDING": 2, "FLUSH_INTERVAL": 60})
+    def test_flush_on_max_pending(self):
+        another = Tweet.objects.create(user=self.user, content="another")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+            self.client.post(reverse("tweets:like", kwargs={"pk": another.pk}))
+        self.tweet.refresh_from_db()
+        another.refresh_from_db()
+
+        self.assertEqual(self.tweet.like_count, 1)
+        self.assertEqual(another.like_count, 1)
+
+
+class TestReconcileLikeCounts(BaseTestCase):
+    def test_reconcile(self):
+        Like.objects.create(user=self.user, tweet=self.tweet)
+        drifted = Tweet.objects.create(user=self.user, content="drifted", like_count=5)
+        call_command("reconcile_like_counts", stdout=StringIO())
+        self.tweet.refresh_from_db()
+        drifted.refresh_from_db()
+
+        self.assertEqual(self.tweet.like_count, 1)
+        self.assertEqual(drifted.like_count, 0)
+
+
+@skipUnless(connection.vendor in ("sqlite", "postgresql"), "EXPLAINの解析はSQLiteとPostgreSQLのみ対応")
+class TestQueryPlans(BaseTestCase):
+    # フィード系ページの全SELECTが，全件スキャンや一時B-treeでのソートをしていないことを確認する
+    def setUp(self):
+        super().setUp()
+        self.celebrity = User.objects.create_user(username="celebrity", password="testpass", is_pull_author=True)
+        self.followee = User.objects.create_user(username="followee", password="testpass")
+        FriendShip.objects.create(follower=self.user, followee=self.celebrity)
+        FriendShip.objects.create(follower=self.user, followee=self.followee)
+        Tweet.objects.create(user=self.celebrity, content="celebrity")
+        Tweet.objects.create(user=self.followee, content="followee")
+        Like.objects.create(user=self.user, tweet=self.tweet)
+
+    def capture_selects(self, url):
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [(sql, params) for sql, params in queries if sql.lstrip().upper().startswith("SELECT")]
+
+    def assert_index_only_plans(self, url):
+        plan_problems = sqlite_plan_problems if connection.vendor == "sqlite" else postgresql_plan_problems
+        queries = self.capture_selects(url)
+        self.assertTrue(queries)
+        with connection.cursor() as cursor:
+            for sql, params in queries:
+                with self.subTest(sql=sql):
+                    self.assertEqual(plan_problems(cursor, sql, params), [])
+
+    def test_home(self):
+        self.assert_index_only_plans(reverse("tweets:home"))
+
+    def test_user_profile(self):
+        self.assert_index_only_plans(reverse("accounts:user_profile", kwargs={"username": "celebrity"}))
+
+    def test_tweet_detail(self):
+        self.assert_index_only_plans(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
+
+    def test_follow_lists(self):
+        self.assert_index_only_plans(reverse("accounts:following_list", kwargs={"username": "testuser"}))
+        self.assert_index_only_plans(reverse("accounts:follower_list", kwargs={"username": "celebrity"}))
+
+
+class TestSQLiteTuning(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        # DJANGO_DATABASE=postgresql でも動くよう，接続先と OPTIONS はSQLite用に置き換える
+        self.settings_dict = {
+            **connection.settings_dict,
+            "ENGINE": "mysite.sqlite3",
+            "NAME": str(Path(tmpdir.name) / "tuned.sqlite3"),
+            "OPTIONS": {},
+        }
+        with self.connect() as conn, conn.cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER)")
+            cursor.execute("INSERT INTO counter VALUES (1, 0)")
+
+    @contextmanager
+    def connect(self):
+        # connections はスレッドごとなので，呼び出したスレッドに "tuned" として登録する
+        conn = connections["tuned"] = TunedSQLiteWrapper(self.settings_dict, alias="tuned")
+        try:
+            yield conn
+        finally:
+            conn.close()
+            del connections["tuned"]
+
+    def test_pragmas(self):
+        with self.connect() as conn, conn.cursor() as cursor:
+            pragmas = {
+                name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ("journal_mode", "synchronous", "busy_timeout")
+            }
+
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000})
+
+    def test_concurrent_write_transactions(self):
+        errors = []
+
+        def increment():
+            try:
+                with self.connect() as conn:
+                    for _ in range(20):
+                        with transaction.atomic(using="tuned"), conn.cursor() as cursor:
+                            value = cursor.execute("SELECT value FROM counter").fetchone()[0]
+                            cursor.execute("UPDATE counter SET value = %s", [value + 1])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with self.connect() as conn, conn.cursor() as cursor:
+            self.assertEqual(cursor.execute("SELECT value FROM counter").fetchone()[0], 80)
+
+
+@override_settings(READ_REPLICAS=["replica"], REPLICA_PIN_SECONDS=60)
+class TestReadReplicaRouting(BaseTestCase):
+    # テストではレプリカは別DBになり複製されないので，どちらを読んだかが結果に表れる
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("tweets:home")
+
+    def test_read_only_view_uses_replica(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["tweet_list"], [])
+
+    def test_write_pins_session_to_primary(self):
+        self.client.post(reverse("tweets:create"), {"content": "new"})
+        response = self.client.get(self.url)
+
+        self.assertEqual([tweet.content for tweet in response.context["tweet_list"]], ["new", "test"])
+
+        session = self.client.session
+        session[PINNED_UNTIL_SESSION_KEY] = 0
+        session.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["tweet_list"], [])
+
+    @override_settings(FEED_STREAMING={"ENABLED": True, "PAGE_SIZE": 5, "CHUNK_SIZE": 2})
+    def test_streamed_feed_reads_replica(self):
+        User.objects.using("replica").create(id=self.user.id, username="testuser")
+        tweet = Tweet.objects.using("replica").create(user_id=self.user.id, content="from-replica")
+        TimelineEntry.objects.using("replica").create(
+            user_id=self.user.id, tweet=tweet, author_id=self.user.id, created_at=tweet.created_at
+        )
+        response = self.client.get(self.url)
+
+        self.assertIn("from-replica", b"".join(response.streaming_content).decode())
+
+    def test_async_write_pins_session_to_primary(self):
+        self.client.post(reverse("tweets:async_like", kwargs={"pk": self.tweet.pk}))
+
+        self.assertIn(PINNED_UNTIL_SESSION_KEY, self.client.session)
+
+    def test_failed_write_does_not_pin(self):
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk + 100}))
+
+        self.assertNotIn(PINNED_UNTIL_SESSION_KEY, self.client.session)
+
+
+class RecordingBroker(live.Broker):
+    # テスト用の配信先。publish された内容を記録するだけ
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, event, data):
+        self.published.append((channel, event, data))
+
+
+@override_settings(LIVE_UPDATES={"BROKER": "tweets.tests.RecordingBroker", "HEARTBEAT": 15, "MAX_QUEUE": 100})
+class TestLivePublish(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        live.get_broker.cache_clear()
+
+    def test_publish_new_tweet(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tweet = Tweet.objects.create(user=self.user, content="new")
+
+        self.assertEqual(
+            live.get_broker().published, [(live.author_channel(self.user.id), "tweet", {"tweet_id": tweet.id})]
+        )
+
+    def test_publish_like_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+            self.client.post(reverse("tweets:async_unlike", kwargs={"pk": self.tweet.pk}))
+
+        self.assertEqual(
+            live.get_broker().published,
+            [
+                (live.tweet_channel(self.tweet.id), "like", {"tweet_id": self.tweet.id, "liked_count": 1}),
+                (live.tweet_channel(self.tweet.id), "like", {"tweet_id": self.tweet.id, "liked_count": 0}),
+            ],
+        )
+
+
+@override_settings(LIVE_UPDATES={"BROKER": "tweets.live.InProcessBroker", "HEARTBEAT": 15, "MAX_QUEUE": 100})
+class TestLiveStream(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        live.get_broker.cache_clear()
+        self.followee = User.objects.create_user(username="followee", password="testpass")
+        FriendShip.objects.create(follower=self.user, followee=self.followee)
+
+    def scope(self, cookie=b"", path=live.STREAM_PATH):
+        return {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": f"ids={self.tweet.id}".encode(),
+            "headers": [(b"cookie", cookie)],
+        }
+
+    async def test_stream_events(self):
+        from mysite.asgi import application
+
+        cookie = f"sessionid={self.client.cookies['sessionid'].value}".encode()
+        communicator = ApplicationCommunicator(application, self.scope(cookie))
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output(timeout=5)
+        self.assertEqual(start["status"], 200)
+        self.assertEqual((await communicator.receive_output(timeout=5))["body"], b": connected\n\n")
+
+        broker = live.get_broker()
+        broker.publish(live.author_channel(self.followee.id + 100), "tweet", {"tweet_id": 0})
+        await sync_to_async(broker.publish)(live.author_channel(self.followee.id), "tweet", {"tweet_id": 1})
+        broker.publish(live.tweet_channel(self.tweet.id), "like", {"tweet_id": self.tweet.id, "liked_count": 1})
+        first = (await communicator.receive_output(timeout=5))["body"]
+        second = (await communicator.receive_output(timeout=5))["body"]
+
+        self.assertEqual(first, live.format_event("tweet", {"tweet_id": 1}))
+        self.assertEqual(second, live.format_event("like", {"tweet_id": self.tweet.id, "liked_count": 1}))
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait(timeout=5)
+        self.assertEqual(live.get_broker()._subscriptions, {})
+
+    async def test_stream_requires_login(self):
+        from mysite.asgi import application
+
+        communicator = ApplicationCommunicator(application, self.scope())
+        await communicator.send_input({"type": "http.request"})
+
+        self.assertEqual((await communicator.receive_output(timeout=5))["status"], 403)
+
+    def test_wsgi_page_does_not_subscribe(self):
+        self.assertNotContains(self.client.get(reverse("tweets:home")), "data-live-url")
+
+    async def test_asgi_page_subscribes(self):
+        from mysite import asgi
+
+        scopes = []
+
+        async def django_application(scope, receive, send):
+            scopes.append(scope)
+
+        with mock.patch.object(asgi, "django_application", django_application):
+            await asgi.application(self.scope(path=reverse("tweets:home")), None, None)
+        context = live_updates(ASGIRequest(scopes[0], BytesIO()))
+
+        self.assertEqual(context, {"live_url": live.STREAM_PATH})
+        self.assertIn(f'data-live-url="{live.STREAM_PATH}"', render_to_string("base.html", context))
+
+
+@override_settings(FEED_STREAMING={"ENABLED": True, "PAGE_SIZE": 5, "CHUNK_SIZE": 2})
+class TestStreamingFeed(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(6):
+            Tweet.objects.create(user=self.user, content=f"tweet{i}")
+        self.tweets = list(Tweet.objects.order_by("-created_at", "-id"))
+
+    def get_streamed(self, url, data=None):
+        response = self.client.get(url, data)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def assert_streamed_pages(self, url):
+        first = self.get_streamed(url)
+        positions = [first.index(reverse("tweets:detail", kwargs={"pk": tweet.pk})) for tweet in self.tweets[:5]]
+        self.assertEqual(positions, sorted(positions))
+        self.assertNotIn(reverse("tweets:detail", kwargs={"pk": self.tweets[5].pk}), first)
+        self.assertTrue(first.rstrip().endswith("</html>"))
+
+        cursor = re.search(r'href="\?cursor=([^"]+)"', first).group(1)
+        second = self.get_streamed(url, {"cursor": unquote(cursor)})
+        self.assertIn(reverse("tweets:detail", kwargs={"pk": self.tweets[5].pk}), second)
+        self.assertNotIn("?cursor=", second)
+
+    def test_home(self):
+        self.assert_streamed_pages(reverse("tweets:home"))
+
+    def test_user_profile(self):
+        self.assert_streamed_pages(reverse("accounts:user_profile", kwargs={"username": "testuser"}))
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(reverse("tweets:home"), {"cursor": "invalid"})
+
+        self.assertEqual(response.status_code, 404)
+
+    async def test_asgi_renders_without_streaming(self):
+        self.async_client.cookies = self.client.cookies
+        for url in (reverse("tweets:home"), reverse("accounts:user_profile", kwargs={"username": "testuser"})):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+
+                self.assertFalse(response.streaming)
+                self.assertContains(response, reverse("tweets:detail", kwargs={"pk": self.tweets[0].pk}))
+                self.assertTrue(response.content.decode().rstrip().endswith("</html>"))
+
+
+class TestStaticFiles(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        tmpdir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmpdir.cleanup)
+        cls.static_root = Path(tmpdir.name)
+        storage = override_settings(
+            STATIC_ROOT=cls.static_root,
+            STATICFILES_STORAGE="whitenoise.storage.CompressedManifestStaticFilesStorage",
+        )
+        storage.enable()
+        cls.addClassCleanup(storage.disable)
+        call_command("collectstatic", interactive=False, verbosity=0, ignore_patterns=["admin"])
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        hashed = staticfiles_storage.stored_name("ajax.js")
+
+        self.assertRegex(hashed, r"^ajax\.[0-9a-f]{12}\.js$")
+        for suffix in ("", ".gz", ".br"):
+            self.assertTrue((self.static_root / f"{hashed}{suffix}").exists())
+
+    def test_wsgi_serves_hashed_file_as_immutable(self):
+        from mysite.wsgi import application
+
+        environ = {"REQUEST_METHOD": "GET", "PATH_INFO": static("css/styles.css"), "HTTP_ACCEPT_ENCODING": "br, gzip"}
+        start_response = mock.Mock()
+        body = b"".join(application(environ, start_response))
+
+        status, headers = start_response.call_args.args
+        headers = dict(headers)
+        self.assertEqual(status, "200 OK")
+        self.assertIn("immutable", headers["Cache-Control"])
+        self.assertEqual(headers["Content-Encoding"], "br")
+        self.assertEqual(len(body), int(headers["Content-Length"]))
+
+    async def test_asgi_serves_hashed_file_as_immutable(self):
+        from mysite.asgi import application
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": static("css/styles.css"),
+            "query_string": b"",
+            "headers": [(b"accept-encoding", b"br, gzip")],
+        }
+        communicator = ApplicationCommunicator(application, scope)
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output(timeout=5)
+        body = b""
+        while True:
+            message = await communicator.receive_output(timeout=5)
+            body += message["body"]
+            if not message.get("more_body"):
+                break
+
+        headers = dict(start["headers"])
+        self.assertEqual(start["status"], 200)
+        self.assertIn(b"immutable", headers[b"cache-control"])
+        self.assertEqual(headers[b"content-encoding"], b"br")
+        self.assertEqual(len(body), int(headers[b"content-length"]))
+
+
+class TestGenerateLoadData(TestCase):
+    def generate(self, prefix, seed=1):
+        call_command(
+            "generate_load_data",
+            users=30,
+            tweets=60,
+            follows=4,
+            likes=120,
+            seed=seed,
+            prefix=prefix,
+            batch_size=7,
+            stdout=StringIO(),
+        )
+        return prefix
+
+    def snapshot(self, prefix):
+        def strip(username):
+            return username[len(prefix) :]
+
+        follows = FriendShip.objects.filter(follower__username__startswith=prefix)
+        tweets = Tweet.objects.filter(user__username__startswith=prefix).order_by("id")
+        return (
+            sorted((strip(a), strip(b)) for a, b in follows.values_list("follower__username", "followee__username")),
+            [(strip(username), count) for username, count in tweets.values_list("user__username", "like_count")],
+        )
+
+    def test_generate(self):
+        self.generate("load-")
+        users = User.objects.filter(username__startswith="load-")
+        tweets = Tweet.objects.filter(user__in=users)
+
+        self.assertEqual(users.count(), 30)
+        self.assertEqual(tweets.count(), 60)
+        self.assertEqual(Like.objects.count(), tweets.aggregate(total=Sum("like_count"))["total"])
+        for user in users:
+            self.assertEqual(user.follower_count, FriendShip.objects.filter(followee=user).count())
+            self.assertEqual(user.following_count, FriendShip.objects.filter(follower=user).count())
+        expected_entries = sum(1 + FriendShip.objects.filter(followee_id=tweet.user_id).count() for tweet in tweets)
+        self.assertEqual(TimelineEntry.objects.count(), expected_entries)
+        # created_at は生成時刻ではなく，--days の期間に散らばる
+        month_ago = timezone.now() - timedelta(days=29)
+        self.assertTrue(tweets.filter(created_at__lt=month_ago).exists())
+        self.assertFalse(Like.objects.filter(created_at__lt=F("tweet__created_at")).exists())
+        self.assertTrue(FriendShip.objects.filter(follower__in=users, created_at__lt=month_ago).exists())
+
+    def test_reproducible_with_seed(self):
+        first = self.snapshot(self.generate("load-a-"))
+        second = self.snapshot(self.generate("load-b-"))
+        other = self.snapshot(self.generate("load-c-", seed=2))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_failure_with_existing_prefix(self):
+        User.objects.create_user(username="testuser", password="testpass")
+        with self.assertRaises(CommandError):
+            self.generate("testuser")
+
+
+class TestBenchUrls(SimpleTestCase):
+    def test_every_route_has_scenario(self):
+        self.assertEqual({url_name for _, url_name, _ in bench_urls.ROUTES}, bench_urls.url_names())
+        for _, _, scenario in bench_urls.ROUTES:
+            self.assertTrue(hasattr(bench_urls.Command, f"scenario_{scenario}"))
@@ -0,0 +1,115 @@
+import heapq
+from itertools import chain, islice
+
+from django.conf import settings
+
+from accounts.graph import follow_graph
+from accounts.models import FriendShip, User
+
+from .models import TimelineEntry, Tweet
+from .pagination import CursorPage, decode_cursor, encode_cursor, keyset_filter
+
+BATCH_SIZE = 1000
+
+
+def _bulk_insert(entries):
+    entries = iter(entries)
+    while batch := list(islice(entries, BATCH_SIZE)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_tweet(tweet):
+    user_ids = [tweet.user_id]
+    if not tweet.user.is_pull_author:
+        follower_ids = FriendShip.objects.filter(followee_id=tweet.user_id).values_list("follower_id", flat=True)
+        user_ids = chain(user_ids, follower_ids.iterator())
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, tweet_id=tweet.id, author_id=tweet.user_id, created_at=tweet.created_at)
+        for user_id in user_ids
+    )
+
+
+def backfill(friendship):
+    if friendship.followee.is_pull_author:
+        return
+    tweets = (
+        Tweet.objects.filter(user_id=friendship.followee_id)
+        .order_by("-created_at", "-id")
+        .values_list("id", "created_at")[: settings.TIMELINE_BACKFILL_LIMIT]
+    )
+    _bulk_insert(
+        TimelineEntry(
+            user_id=friendship.follower_id,
+            tweet_id=tweet_id,
+            author_id=friendship.followee_id,
+            created_at=created_at,
+        )
+        for tweet_id, created_at in tweets
+    )
+
+
+def prune(friendship):
+    TimelineEntry.objects.filter(user_id=friendship.follower_id, author_id=friendship.followee_id).delete()
+
+
+def switch_to_pull(user):
+    user.is_pull_author = True
+    user.save(update_fields=["is_pull_author"])
+    TimelineEntry.objects.filter(author=user).exclude(user=user).delete()
+
+
+def switch_to_push(user):
+    user.is_pull_author = False
+    user.save(update_fields=["is_pull_author"])
+    for friendship in FriendShip.objects.filter(followee=user).select_related("followee").iterator():
+        backfill(friendship)
+
+
+class TimelinePaginator:
+    # 事前計算済みのタイムラインと，フォロワーの多いユーザーのツイートを
+    # (created_at, id) の降順でk-wayマージする
+    def __init__(self, user, per_page):
+        self.user = user
+        self.per_page = per_page
+
+    def get_pull_author_ids(self):
+        if settings.FOLLOW_GRAPH["ENABLED"]:
+            # pull型の著者(フォロワーの多い少数のユーザー)のうちフォロー中のものを，プロセス内のフォローグラフで絞る
+            # 他のプロセスでのフォロー・解除は FOLLOW_GRAPH["TIMEOUT"] 秒以内に反映される
+            pull_author_ids = User.objects.filter(is_pull_author=True).values_list("id", flat=True)
+            return follow_graph.filter_followed(self.user.pk, pull_author_ids)
+        return FriendShip.objects.filter(follower=self.user, followee__is_pull_author=True).values_list(
+            "followee_id", flat=True
+        )
+
+    def get_sources(self):
+        sources = [TimelineEntry.objects.filter(user=self.user).values_list("created_at", "tweet_id")]
+        for author_id in self.get_pull_author_ids():
+            sources.append(Tweet.objects.filter(user_id=author_id).values_list("created_at", "id"))
+        return sources
+
+    def page(self, token=None):
+        cursor = decode_cursor(token) if token else None
+        streams = []
+        for source in self.get_sources():
+            pk_field = "tweet_id" if source.model is TimelineEntry else "id"
+            source = source.order_by("-created_at", f"-{pk_field}")
+            if cursor:
+                source = keyset_filter(source, cursor, pk_field=pk_field)
+            streams.append(source[: self.per_page + 1])
+
+        rows = []
+        seen = set()
+        for created_at, tweet_id in heapq.merge(*streams, reverse=True):
+            if tweet_id in seen:
+                continue
+            seen.add(tweet_id)
+            rows.append((created_at, tweet_id))
+            if len(rows) > self.per_page:
+                break
+
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[: self.per_page]
+            next_cursor = encode_cursor(*rows[-1])
+        return CursorPage([tweet_id for _, tweet_id in rows], next_cursor)
@@ -6,9 +6,12 @@ app_name = "tweets"
 
 urlpatterns = [
     path("home/", views.HomeView.as_view(), name="home"),
+    path("likes/", views.LikeStateView.as_view(), name="like_states"),
     path("create/", views.TweetCreateView.as_view(), name="create"),
     path("<int:pk>/", views.TweetDetailView.as_view(), name="detail"),
     path("<int:pk>/delete/", views.TweetDeleteView.as_view(), name="delete"),
     path("<int:pk>/like/", views.LikeView.as_view(), name="like"),
     path("<int:pk>/unlike/", views.UnlikeView.as_view(), name="unlike"),
+    path("<int:pk>/like/async/", views.AsyncLikeView.as_view(), name="async_like"),
+    path("<int:pk>/unlike/async/", views.AsyncUnlikeView.as_view(), name="async_unlike"),
 ]
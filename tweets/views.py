@@ -1,33 +1,61 @@
 # from django.shortcuts import render
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Count, Prefetch
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, View
 
+from accounts.mixins import AsyncLoginRequiredMixin
+from mysite.routers import PinPrimaryMixin, ReadReplicaMixin
+
+from . import cards, likes, timeline
+from .conditional import ConditionalGetMixin
+from .counters import like_counter
 from .models import Like, Tweet
+from .pagination import CursorPage, CursorPaginationMixin
+from .streaming import StreamingFeedMixin, chunked
 
 # ListViewはquerysetで取得する
 # queryset使わずcontextで渡すならTemplateViewでいい
 
 
-class HomeView(LoginRequiredMixin, ListView):
+class HomeView(LoginRequiredMixin, ReadReplicaMixin, StreamingFeedMixin, CursorPaginationMixin, ListView):
     model = Tweet
     template_name = "tweets/home.html"
     context_object_name = "tweet_list"
 
-    def get_queryset(self):
-        user = self.request.user
-        queryset = (
+    def get_tweets(self, tweet_ids):
+        tweets = (
             Tweet.objects.select_related("user")
-            .prefetch_related(Prefetch("likes", queryset=Like.objects.filter(user=user), to_attr="is_liked"))
-            .annotate(liked_count=Count("likes"))
+            .prefetch_related(
+                Prefetch("likes", queryset=Like.objects.filter(user=self.request.user), to_attr="is_liked")
+            )
+            .in_bulk(tweet_ids)
         )
-        return queryset
-
+        return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
 
-class TweetCreateView(LoginRequiredMixin, CreateView):
+    def get_queryset(self):
+        if self.streaming:
+            return []
+        tweet_ids = self.paginate(timeline.TimelinePaginator(self.request.user, self.page_size))
+        tweet_list = self.get_tweets(tweet_ids)
+        like_counter.apply_pending(tweet_list)
+        return tweet_list
+
+    def get_streaming_page(self):
+        paginator = timeline.TimelinePaginator(self.request.user, settings.FEED_STREAMING["PAGE_SIZE"])
+        page = paginator.page(self.get_cursor())
+        chunks = chunked(page.object_list, settings.FEED_STREAMING["CHUNK_SIZE"])
+        return CursorPage((tweet for tweet_ids in chunks for tweet in self.get_tweets(tweet_ids)), page.next_cursor)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        cards.render_cards(context["tweet_list"])
+        return context
+
+
+class TweetCreateView(LoginRequiredMixin, PinPrimaryMixin, CreateView):
     model = Tweet
     fields = ["content"]
     template_name = "tweets/tweet.html"
@@ -38,22 +66,37 @@ class TweetCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class TweetDetailView(LoginRequiredMixin, DetailView):
+class TweetDetailView(LoginRequiredMixin, ReadReplicaMixin, ConditionalGetMixin, DetailView):
     model = Tweet
     context_object_name = "tweet"
     template_name = "tweets/detail.html"
 
+    def get_etag_parts(self):
+        tweet_id = self.kwargs["pk"]
+        row = (
+            Tweet.objects.filter(pk=tweet_id)
+            .annotate(is_liked=Exists(Like.objects.filter(tweet=OuterRef("pk"), user=self.request.user)))
+            .values_list("user_id", "created_at", "like_count", "is_liked")
+            .first()
+        )
+        if row is None:
+            return None
+        return (*row, like_counter.pending(tweet_id))
+
     def get_queryset(self):
         user = self.request.user
-        queryset = (
-            Tweet.objects.select_related("user")
-            .prefetch_related(Prefetch("likes", queryset=Like.objects.filter(user=user), to_attr="is_liked"))
-            .annotate(liked_count=Count("likes"))
+        queryset = Tweet.objects.select_related("user").prefetch_related(
+            Prefetch("likes", queryset=Like.objects.filter(user=user), to_attr="is_liked")
         )
         return queryset
 
+    def get_object(self, queryset=None):
+        tweet = super().get_object(queryset)
+        like_counter.apply_pending([tweet])
+        return tweet
 
-class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+
+class TweetDeleteView(LoginRequiredMixin, PinPrimaryMixin, UserPassesTestMixin, DeleteView):
     model = Tweet
     context_object_name = "tweet_delete"
     template_name = "tweets/delete.html"
@@ -64,42 +107,96 @@ class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return tweet.user == self.request.user
 
 
-class LikeView(LoginRequiredMixin, View):
+class LikeView(LoginRequiredMixin, PinPrimaryMixin, View):
     def post(self, request, *args, **kwargs):
-        user = self.request.user
         tweet_id = self.kwargs["pk"]
-        tweet = get_object_or_404(Tweet, id=tweet_id)
-        unlike_url = reverse("tweets:unlike", kwargs={"pk": tweet_id})
-        is_liked = True
-
-        Like.objects.get_or_create(user=user, tweet=tweet)
-        likes_count = Like.objects.filter(tweet=tweet).count()
+        liked_count = likes.like(self.request.user.id, tweet_id)
+        if liked_count is None:
+            raise Http404("ツイートが存在しません")
         context = {
-            "liked_count": likes_count,
-            "is_liked": is_liked,
+            "liked_count": liked_count,
+            "is_liked": True,
             "tweet_id": tweet_id,
-            "unlike_url": unlike_url,
+            "unlike_url": reverse("tweets:unlike", kwargs={"pk": tweet_id}),
         }
 
         return JsonResponse(context)
 
 
-class UnlikeView(LoginRequiredMixin, View):
+class UnlikeView(LoginRequiredMixin, PinPrimaryMixin, View):
     def post(self, request, *args, **kwargs):
-        user = self.request.user
         tweet_id = self.kwargs["pk"]
-        tweet = get_object_or_404(Tweet, id=tweet_id)
-        like_url = reverse("tweets:like", kwargs={"pk": tweet_id})
-        is_liked = False
+        liked_count = likes.unlike(self.request.user.id, tweet_id)
+        if liked_count is None:
+            raise Http404("ツイートが存在しません")
+        context = {
+            "liked_count": liked_count,
+            "is_liked": False,
+            "tweet_id": tweet_id,
+            "like_url": reverse("tweets:like", kwargs={"pk": tweet_id}),
+        }
+
+        return JsonResponse(context)
+
+
+class AsyncLikeView(AsyncLoginRequiredMixin, PinPrimaryMixin, View):
+    # LikeView の非同期版。ASGIではスレッドプールを経由せずに処理する
+    async def post(self, request, *args, **kwargs):
+        tweet_id = self.kwargs["pk"]
+        liked_count = await likes.alike(request.user.id, tweet_id)
+        if liked_count is None:
+            raise Http404("ツイートが存在しません")
+        context = {
+            "liked_count": liked_count,
+            "is_liked": True,
+            "tweet_id": tweet_id,
+            "unlike_url": reverse("tweets:async_unlike", kwargs={"pk": tweet_id}),
+        }
+
+        return JsonResponse(context)
 
-        like = Like.objects.filter(user=user, tweet=tweet)
-        like.delete()
-        likes_count = Like.objects.filter(tweet=tweet).count()
+
+class AsyncUnlikeView(AsyncLoginRequiredMixin, PinPrimaryMixin, View):
+    async def post(self, request, *args, **kwargs):
+        tweet_id = self.kwargs["pk"]
+        liked_count = await likes.aunlike(request.user.id, tweet_id)
+        if liked_count is None:
+            raise Http404("ツイートが存在しません")
         context = {
-            "liked_count": likes_count,
-            "is_liked": is_liked,
+            "liked_count": liked_count,
+            "is_liked": False,
             "tweet_id": tweet_id,
-            "like_url": like_url,
+            "like_url": reverse("tweets:async_like", kwargs={"pk": tweet_id}),
+        }
+
+        return JsonResponse(context)
+
+
+class LikeStateView(LoginRequiredMixin, View):
+    max_ids = 100
+
+    def get(self, request, *args, **kwargs):
+        try:
+            tweet_ids = [int(tweet_id) for tweet_id in request.GET.get("ids", "").split(",") if tweet_id]
+        except ValueError:
+            return HttpResponseBadRequest("不正なツイートIDです")
+        if len(tweet_ids) > self.max_ids:
+            return HttpResponseBadRequest(f"一度に取得できるのは{self.max_ids}件までです")
+
+        rows = (
+            Tweet.objects.filter(id__in=tweet_ids)
+            .annotate(is_liked=Exists(Like.objects.filter(tweet=OuterRef("pk"), user=request.user)))
+            .values_list("id", "like_count", "is_liked")
+        )
+        context = {
+            "tweets": [
+                {
+                    "tweet_id": tweet_id,
+                    "liked_count": like_count + like_counter.pending(tweet_id),
+                    "is_liked": is_liked,
+                }
+                for tweet_id, like_count, is_liked in rows
+            ]
         }
 
         return JsonResponse(context)